@@ -1,39 +1,254 @@
 from svn2svn import ui
+from svn2svn import shell
 from svn2svn import svnclient
+from svn2svn.errors import UnsupportedSVNAction
 
-import operator
+import os
+import sys
+import threading
+import Queue
 
 
-def in_svn(p, require_in_repo=False, prefix=""):
+wc_status_cache = {}         # "svn status" entries for WC paths, keyed by path, see _get_wc_status()
+wc_status_cache_dirs = set() # WC dirs whose immediate children are loaded in wc_status_cache
+wc_status_cache_gen = None   # shell.svn_wc_generation that wc_status_cache is valid for
+
+def _get_wc_status(p):
+    """
+    Get the "svn status" entry for a WC path (or None). Rather than one "svn status"
+    per path, fetch the status of the path's parent dir and all its immediate
+    children at once, since callers tend to check many siblings in a row. The
+    cache is thrown away whenever a (potentially) WC-modifying svn command runs.
+    """
+    _check_wc_status_cache()
+    p = p.rstrip('/')
+    parent = p[:p.rfind('/')] if '/' in p else ''
+    if parent not in wc_status_cache_dirs:
+        for d in svnclient.status(parent or '.', depth='immediates'):
+            path = d['path'].replace(os.sep, '/')
+            wc_status_cache[(parent+'/'+path if path else parent) if parent else path] = d
+        wc_status_cache_dirs.add(parent)
+    return wc_status_cache.get(p)
+
+def _check_wc_status_cache():
+    """
+    Throw away the _get_wc_status() cache if the WC may have changed since.
+    """
+    global wc_status_cache_gen
+    if wc_status_cache_gen != shell.svn_wc_generation:
+        wc_status_cache.clear()
+        wc_status_cache_dirs.clear()
+        wc_status_cache_gen = shell.svn_wc_generation
+
+def prefetch_wc_status(paths):
+    """
+    Load the _get_wc_status() cache for the parent dirs of all the given WC paths
+    with a single "svn status" command, rather than one per parent dir, ahead of
+    calling in_svn() on each of them.
+    """
+    _check_wc_status_cache()
+    parents = set()
+    for p in paths:
+        p = p.rstrip('/')
+        parent = p[:p.rfind('/')] if '/' in p else ''
+        # Leave any parent dirs which are gone from disk to _get_wc_status()
+        if parent not in wc_status_cache_dirs and os.path.isdir(parent or '.'):
+            parents.add(parent)
+    if len(parents) < 2:
+        return
+    parents = sorted(parents)
+    for d in svnclient.status_paths(parents, depth='immediates'):
+        wc_status_cache[d['path'].replace(os.sep, '/')] = d
+    wc_status_cache_dirs.update(parents)
+
+def _get_wc_entry(p):
+    """
+    Get the "svn status" entry for a WC path (or None), including the WC root,
+    whose entry is cached (as '') along with its immediate children.
+    """
+    return _get_wc_status(p if p.strip('/.') else '')
+
+def _in_svn_flags(d):
+    if d is None:
+        return (False, False)
+    # Don't consider files tracked as deleted in the WC as under source-control.
+    # Consider files which are locally added/copied as under source-control.
+    in_wc = d['status'] != 'deleted' and (d['type'] == 'normal' or d['status'] == 'added' or d['copied'] == 'true')
+    # Paths which are only locally-added aren't in the SVN repo (yet).
+    in_repo = in_wc and not (d['status'] == 'added' or d['revision'] is None)
+    return (in_wc, in_repo)
+
+def in_svn(p, require_in_repo=False, depth=0):
     """
     Check if a given file/folder is being tracked by Subversion.
     Prior to SVN 1.6, we could "cheat" and look for the existence of ".svn" directories.
     With SVN 1.7 and beyond, WC-NG means only a single top-level ".svn" at the root of the working-copy.
     Use "svn status" to check the status of the file/folder.
     """
-    entries = svnclient.status(p, non_recursive=True)
-    if not entries:
-        return False
-    d = entries[0]
-    if require_in_repo and (d['status'] == 'added' or d['revision'] is None):
-        # If caller requires this path to be in the SVN repo, prevent returning True
-        # for paths that are only locally-added.
-        ret = False
-    else:
-        # Don't consider files tracked as deleted in the WC as under source-control.
-        # Consider files which are locally added/copied as under source-control.
-        ret = True if not (d['status'] == 'deleted') and (d['type'] == 'normal' or d['status'] == 'added' or d['copied'] == 'true') else False
-    ui.status(prefix + ">> in_svn('%s', require_in_repo=%s) --> %s", p, str(require_in_repo), str(ret), level=ui.DEBUG, color='GREEN')
+    in_wc, in_repo = _in_svn_flags(_get_wc_entry(p))
+    # If caller requires this path to be in the SVN repo, prevent returning True
+    # for paths that are only locally-added.
+    ret = in_repo if require_in_repo else in_wc
+    if ui.get_level() >= ui.DEBUG:
+        ui.status(">> in_svn('%s', require_in_repo=%s) --> %s", p, str(require_in_repo), str(ret), level=ui.DEBUG, indent=depth, color='GREEN')
+    return ret
+
+def in_svn_flags(p, depth=0):
+    """
+    Like in_svn(), but answer both questions from a single "svn status" lookup.
+    Returns an (in_wc, in_repo) tuple.
+    """
+    ret = _in_svn_flags(_get_wc_entry(p))
+    if ui.get_level() >= ui.DEBUG:
+        ui.status(">> in_svn_flags('%s') --> %s", p, str(ret), level=ui.DEBUG, indent=depth, color='GREEN')
     return ret
 
 def is_child_path(path, p_path):
-    return True if (path == p_path) or (path.startswith(p_path+"/")) else False
+    return path == p_path or path.startswith(p_path+"/")
+
+def rebase_path(path, old_base, new_base):
+    """
+    Swap the leading 'old_base' path-segments of 'path' for 'new_base', e.g.
+    rebase_path('/branches/fix1/Proj2/file1.txt', '/branches/fix1', '/trunk')
+      --> '/trunk/Proj2/file1.txt'
+    Unlike str.replace(), only the leading prefix is rewritten, so any later
+    segments which happen to contain 'old_base' are left untouched.
+    """
+    assert is_child_path(path, old_base)
+    return new_base + path[len(old_base):]
 
 def join_path(base, child):
     base.rstrip('/')
     return base+"/"+child if child else base
 
-def find_svn_ancestors(svn_repos_url, start_path, start_rev, stop_base_path=None, prefix=""):
+ancestor_log_cache = {}  # Cached find_svn_ancestors() "svn log" lookups, keyed by (url, rev #)
+
+def clear_ancestor_cache():
+    """
+    Drop all cached find_svn_ancestors() "svn log" lookups.
+    """
+    ancestor_log_cache.clear()
+
+def _get_ancestor_log_entry(svn_url, rev):
+    """
+    Get the first "svn log" entry for svn_url (relative to @rev), re-using any
+    earlier lookup of the same url@rev.
+    """
+    key = (svn_url, rev)
+    log_entry = ancestor_log_cache.get(key)
+    if log_entry is None:
+        log_entry = svnclient.get_first_svn_log_entry(svn_url, 1, rev)
+        ancestor_log_cache[key] = log_entry
+    return log_entry
+
+def prefetch_ancestor_logs(svn_repos_url, paths, rev, max_threads=None):
+    """
+    Warm the find_svn_ancestors() cache with the first "svn log" lookup for each
+    of 'paths' (@rev), running the lookups concurrently. Errors are ignored here;
+    find_svn_ancestors() will hit them again (and report them) when it gets there.
+    """
+    def _prefetch(svn_url):
+        try:
+            _get_ancestor_log_entry(svn_url, rev)
+        except Exception:
+            pass
+    urls = [svn_repos_url+p for p in paths if (svn_repos_url+p, rev) not in ancestor_log_cache]
+    if len(urls) > 1:
+        run_parallel([(_prefetch, (url,)) for url in urls], max_threads=max_threads)
+
+def _matching_changed_paths(log_entry, path):
+    """
+    Return the changed_paths entries in log_entry for 'path' and any of its parent
+    paths, deepest path first. Rather than scanning every changed path (merges at
+    the repo root can have thousands), look up each parent of 'path' in a per-entry
+    path index.
+    """
+    by_path = log_entry.get('changed_paths_index')
+    if by_path is None:
+        by_path = dict((d.path, d) for d in log_entry['changed_paths'])
+        log_entry['changed_paths_index'] = by_path
+    matches = []
+    while path:
+        d = by_path.get(path)
+        if d is not None:
+            matches.append(d)
+        path = path[:path.rfind('/')]
+    return matches
+
+def _walk_svn_ancestors(svn_repos_url, start_path, start_rev, stop_base_path, depth):
+    """
+    Walk the copy-from chain for start_path@start_rev, for find_svn_ancestors().
+    Returns the list of ancestors found, or [] if stop_base_path was given but
+    the chain ended (delete, or add/replace without copy-from) before reaching it.
+    """
+    cur_path = start_path
+    cur_rev  = start_rev
+    ancestors = []
+    debug = ui.get_level() >= ui.DEBUG
+    while True:
+        # If we found a copy-from case which matches our stop_base_path, we're done.
+        # ...but only if we've at least followed the first copy-from path. Check this
+        # before fetching the next "svn log" entry, which we'd otherwise throw away.
+        # (For a whole-repo stop_base_path of '', this means just one "svn log" lookup.)
+        if stop_base_path is not None and ancestors and is_child_path(cur_path, stop_base_path):
+            ui.status(">> find_svn_ancestors: Done: Found is_child_path(cur_path, stop_base_path)", level=ui.DEBUG, indent=depth, color='YELLOW')
+            return ancestors
+        # Get the first "svn log" entry for cur_path (relative to @cur_rev)
+        if debug:
+            ui.status(">> find_svn_ancestors: %s", svn_repos_url+cur_path+"@"+str(cur_rev), level=ui.DEBUG, indent=depth, color='YELLOW')
+        log_entry = _get_ancestor_log_entry(svn_repos_url+cur_path, cur_rev)
+        if not log_entry:
+            ui.status(">> find_svn_ancestors: Done: no log_entry", level=ui.DEBUG, indent=depth, color='YELLOW')
+            return ancestors
+        # Search for any actions on our target path (or parent paths), starting with
+        # the most-granular (deepest in the tree) path.
+        changed_paths = _matching_changed_paths(log_entry, cur_path)
+        if not changed_paths:
+            # If no matches, then we've hit the end of the ancestry-chain.
+            ui.status(">> find_svn_ancestors: Done: No matching changed_paths", level=ui.DEBUG, indent=depth, color='YELLOW')
+            return ancestors
+        # Find the action for our cur_path in this revision. Use a loop to check in reverse order,
+        # so that if the target file/folder is "M" but has a parent folder with an "A" copy-from
+        # then we still correctly match the deepest copy-from.
+        for d in changed_paths:
+            action = d.action
+            if action not in svnclient.valid_svn_actions:
+                raise UnsupportedSVNAction("In SVN rev. %d: action '%s' not supported. Please report a bug!"
+                    % (log_entry['revision'], action))
+            if debug:
+                ui.status("> %s %s%s", action, d.path,
+                    (" (from %s)" % (d.copyfrom_path+"@"+str(d.copyfrom_revision))) if d.copyfrom_path else "",
+                    level=ui.DEBUG, indent=depth, color='YELLOW')
+            if action == 'M':
+                continue
+            if action == 'D' or not d.copyfrom_path:
+                # If file/folder was deleted, or was added/replaced but not a copy,
+                # the ancestry-chain stops here.
+                ui.status(">> find_svn_ancestors: Done: %s",
+                    "deleted" if action == 'D' else
+                    ("%s with no copyfrom_path" % ("Added" if action == "A" else "Replaced")),
+                    level=ui.DEBUG, indent=depth, color='YELLOW')
+                # If we're tracing back ancestry to a specific target stop_base_path,
+                # there is no ancestry chaining back to that target.
+                return [] if stop_base_path else ancestors
+            # Else, file/folder was added/replaced and is a copy, so add an entry to our ancestors list
+            # and keep checking for ancestors
+            if debug:
+                ui.status(">> find_svn_ancestors: Found copy-from (action=%s): %s --> %s",
+                    action, d.path, d.copyfrom_path+"@"+str(d.copyfrom_revision),
+                    level=ui.DEBUG, indent=depth, color='YELLOW')
+            copyfrom_path = rebase_path(cur_path, d.path, d.copyfrom_path)
+            ancestors.append({'path': cur_path, 'revision': log_entry['revision'],
+                'copyfrom_path': copyfrom_path, 'copyfrom_rev': d.copyfrom_revision})
+            cur_path = copyfrom_path
+            cur_rev =  d.copyfrom_revision
+            # Follow the copy and keep on searching
+            break
+        else:
+            # Only "modify" actions on cur_path and its parents: nothing more to follow.
+            return ancestors
+
+def find_svn_ancestors(svn_repos_url, start_path, start_rev, stop_base_path=None, depth=0):
     """
     Given an initial starting path+rev, walk the SVN history backwards to inspect the
     ancestry of that path, optionally seeing if it traces back to stop_base_path.
@@ -54,103 +269,120 @@ def find_svn_ancestors(svn_repos_url, start_path, start_rev, stop_base_path=None
     'stop_base_path' is the path in the SVN repo to stop tracing ancestry once we've reached,
       i.e. the target path we're trying to trace ancestry back to, e.g. '/trunk'.
     """
-    ui.status(prefix + ">> find_svn_ancestors: Start: (%s) start_path: %s  stop_base_path: %s",
-        svn_repos_url, start_path+"@"+str(start_rev), stop_base_path, level=ui.DEBUG, color='YELLOW')
-    done = False
-    no_ancestry = False
-    cur_path = start_path
-    cur_rev  = start_rev
-    first_iter_done = False
-    ancestors = []
-    while not done:
-        # Get the first "svn log" entry for cur_path (relative to @cur_rev)
-        ui.status(prefix + ">> find_svn_ancestors: %s", svn_repos_url+cur_path+"@"+str(cur_rev), level=ui.DEBUG, color='YELLOW')
-        log_entry = svnclient.get_first_svn_log_entry(svn_repos_url+cur_path, 1, cur_rev)
-        if not log_entry:
-            ui.status(prefix + ">> find_svn_ancestors: Done: no log_entry", level=ui.DEBUG, color='YELLOW')
-            done = True
-            break
-        # If we found a copy-from case which matches our stop_base_path, we're done.
-        # ...but only if we've at least tried to search for the first copy-from path.
-        if stop_base_path is not None and first_iter_done and is_child_path(cur_path, stop_base_path):
-            ui.status(prefix + ">> find_svn_ancestors: Done: Found is_child_path(cur_path, stop_base_path) and first_iter_done=True", level=ui.DEBUG, color='YELLOW')
-            done = True
-            break
-        first_iter_done = True
-        # Search for any actions on our target path (or parent paths).
-        changed_paths_temp = []
-        for d in log_entry['changed_paths']:
-            path = d['path']
-            if is_child_path(cur_path, path):
-                changed_paths_temp.append({'path': path, 'data': d})
-        if not changed_paths_temp:
-            # If no matches, then we've hit the end of the ancestry-chain.
-            ui.status(prefix + ">> find_svn_ancestors: Done: No matching changed_paths", level=ui.DEBUG, color='YELLOW')
-            done = True
-            continue
-        # Reverse-sort any matches, so that we start with the most-granular (deepest in the tree) path.
-        changed_paths = sorted(changed_paths_temp, key=operator.itemgetter('path'), reverse=True)
-        # Find the action for our cur_path in this revision. Use a loop to check in reverse order,
-        # so that if the target file/folder is "M" but has a parent folder with an "A" copy-from
-        # then we still correctly match the deepest copy-from.
-        for v in changed_paths:
-            d = v['data']
-            path = d['path']
-            # Check action-type for this file
-            action = d['action']
-            if action not in svnclient.valid_svn_actions:
-                raise UnsupportedSVNAction("In SVN rev. %d: action '%s' not supported. Please report a bug!"
-                    % (log_entry['revision'], action))
-            ui.status(prefix + "> %s %s%s", action, path,
-                (" (from %s)" % (d['copyfrom_path']+"@"+str(d['copyfrom_revision']))) if d['copyfrom_path'] else "",
-                level=ui.DEBUG, color='YELLOW')
-            if action == 'D':
-                # If file/folder was deleted, ancestry-chain stops here
-                if stop_base_path:
-                    no_ancestry = True
-                ui.status(prefix + ">> find_svn_ancestors: Done: deleted", level=ui.DEBUG, color='YELLOW')
-                done = True
-                break
-            if action in 'RA':
-                # If file/folder was added/replaced but not a copy, ancestry-chain stops here
-                if not d['copyfrom_path']:
-                    if stop_base_path:
-                        no_ancestry = True
-                    ui.status(prefix + ">> find_svn_ancestors: Done: %s with no copyfrom_path",
-                        "Added" if action == "A" else "Replaced",
-                        level=ui.DEBUG, color='YELLOW')
-                    done = True
-                    break
-                # Else, file/folder was added/replaced and is a copy, so add an entry to our ancestors list
-                # and keep checking for ancestors
-                ui.status(prefix + ">> find_svn_ancestors: Found copy-from (action=%s): %s --> %s",
-                    action, path, d['copyfrom_path']+"@"+str(d['copyfrom_revision']),
-                    level=ui.DEBUG, color='YELLOW')
-                ancestors.append({'path': cur_path, 'revision': log_entry['revision'],
-                    'copyfrom_path': cur_path.replace(d['path'], d['copyfrom_path']), 'copyfrom_rev': d['copyfrom_revision']})
-                cur_path = cur_path.replace(d['path'], d['copyfrom_path'])
-                cur_rev =  d['copyfrom_revision']
-                # Follow the copy and keep on searching
-                break
-    if stop_base_path and no_ancestry:
-        # If we're tracing back ancestry to a specific target stop_base_path and
-        # the ancestry-chain stopped before we reached stop_base_path, then return
-        # nothing since there is no ancestry chaining back to that target.
-        ancestors = []
+    debug = ui.get_level() >= ui.DEBUG
+    if debug:
+        ui.status(">> find_svn_ancestors: Start: (%s) start_path: %s  stop_base_path: %s",
+            svn_repos_url, start_path+"@"+str(start_rev), stop_base_path, level=ui.DEBUG, indent=depth, color='YELLOW')
+    ancestors = _walk_svn_ancestors(svn_repos_url, start_path, start_rev, stop_base_path, depth)
     if ancestors:
-        if ui.get_level() >= ui.DEBUG:
-            max_len = 0
-            for idx in range(len(ancestors)):
-                d = ancestors[idx]
-                max_len = max(max_len, len(d['path']+"@"+str(d['revision'])))
-            ui.status(prefix + ">> find_svn_ancestors: Found parent ancestors:", level=ui.DEBUG, color='YELLOW_B')
-            for idx in range(len(ancestors)):
-                d = ancestors[idx]
-                ui.status(prefix + " [%s] %s --> %s", idx,
-                    str(d['path']+"@"+str(d['revision'])).ljust(max_len),
-                    str(d['copyfrom_path']+"@"+str(d['copyfrom_rev'])),
-                    level=ui.DEBUG, color='YELLOW')
-    else:
-        ui.status(prefix + ">> find_svn_ancestors: No ancestor-chain found: %s",
-            svn_repos_url+start_path+"@"+str(start_rev), level=ui.DEBUG, color='YELLOW')
+        if debug:
+            labels = [d['path']+"@"+str(d['revision']) for d in ancestors]
+            max_len = max(len(label) for label in labels)
+            ui.status(">> find_svn_ancestors: Found parent ancestors:", level=ui.DEBUG, indent=depth, color='YELLOW_B')
+            for idx, d in enumerate(ancestors):
+                ui.status(" [%s] %s --> %s", idx,
+                    labels[idx].ljust(max_len),
+                    d['copyfrom_path']+"@"+str(d['copyfrom_rev']),
+                    level=ui.DEBUG, indent=depth, color='YELLOW')
+    elif debug:
+        ui.status(">> find_svn_ancestors: No ancestor-chain found: %s",
+            svn_repos_url+start_path+"@"+str(start_rev), level=ui.DEBUG, indent=depth, color='YELLOW')
     return ancestors
+
+def run_parallel(calls, max_threads=None):
+    """
+    Run several independent (e.g. read-only "svn info") calls concurrently.
+    'calls' is a list of (func, args) tuples, run on at most 'max_threads'
+    threads (default: one thread per call). Returns the list of results, in the
+    same order as 'calls'. If any call raised an exception, the first one (in
+    'calls' order) is re-raised once all calls have finished. Calls may start
+    external programs, since shell.py starts those with close_fds (so children
+    started from different threads don't hold each other's pipes open).
+    """
+    results = [None] * len(calls)
+    errors = [None] * len(calls)
+    pending = range(len(calls))
+    pending.reverse()
+    lock = threading.Lock()
+    def _run():
+        while True:
+            lock.acquire()
+            try:
+                if not pending:
+                    return
+                idx = pending.pop()
+            finally:
+                lock.release()
+            func, args = calls[idx]
+            try:
+                results[idx] = func(*args)
+            except:
+                errors[idx] = sys.exc_info()
+    num_threads = len(calls)
+    if max_threads:
+        num_threads = min(num_threads, max_threads)
+    if num_threads <= 1:
+        _run()
+    else:
+        threads = []
+        for i in range(num_threads):
+            t = threading.Thread(target=_run)
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+    for exc_info in errors:
+        if exc_info:
+            raise exc_info[0], exc_info[1], exc_info[2]
+    return results
+
+def prefetch_iter(iterable, size=10):
+    """
+    Iterate over 'iterable' from a background thread, keeping up to 'size' items
+    fetched ahead of the caller, e.g. so that fetching and parsing the next "svn
+    log" entries overlaps with replaying the current one. Any exception raised
+    while iterating is re-raised to the caller.
+    """
+    q = Queue.Queue(size)
+    stopped = threading.Event()
+    done = object()
+    def _put(item):
+        while not stopped.isSet():
+            try:
+                q.put(item, True, 0.5)
+                return True
+            except Queue.Full:
+                pass
+        return False
+    def _run():
+        it = iter(iterable)
+        try:
+            for item in it:
+                if not _put((item, None)):
+                    # Caller stopped iterating early
+                    break
+            else:
+                _put((done, None))
+        except:
+            _put((done, sys.exc_info()))
+        if hasattr(it, 'close'):
+            it.close()
+    t = threading.Thread(target=_run)
+    t.daemon = True
+    t.start()
+    try:
+        while True:
+            try:
+                # Use a timeout, else (on Python 2) a blocking get() can't be interrupted by Ctrl-C
+                item, exc_info = q.get(True, 1.0)
+            except Queue.Empty:
+                continue
+            if item is done:
+                if exc_info:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                return
+            yield item
+    finally:
+        stopped.set()
+        # Give the thread a moment to notice and clean-up (e.g. stop "svn log")
+        t.join(2.0)
@@ -22,20 +22,21 @@ def real_main(args):
     repos_path = url[len(repos_root):]
     ancestors = find_svn_ancestors(repos_root, repos_path, options.revision)
     if ancestors:
-        max_len = 0
-        for idx in range(len(ancestors)):
-            d = ancestors[idx]
-            max_len = max(max_len, len(d['path']+"@"+str(d['revision'])))
-        for idx in range(len(ancestors)):
-            d = ancestors[idx]
+        labels = [d['path']+"@"+str(d['revision']) for d in ancestors]
+        max_len = max(len(label) for label in labels)
+        for idx, d in enumerate(ancestors):
             ui.status("[%s] %s --> %s", len(ancestors)-idx-1,
-                str(d['path']+"@"+str(d['revision'])).ljust(max_len),
-                str(d['copyfrom_path']+"@"+str(d['copyfrom_rev'])))
+                labels[idx].ljust(max_len),
+                d['copyfrom_path']+"@"+str(d['copyfrom_rev']))
     else:
         ui.status("No ancestor-chain found: %s", repos_root+repos_path+"@"+str(options.revision))
 
     return 0
 
+# Reg-ex for matching a revision arg (http://svnbook.red-bean.com/en/1.5/svn.tour.revs.specifiers.html#svn.tour.revs.dates)
+rev_patt = '[0-9A-Z]+|\{[0-9A-Za-z/\\ :-]+\}'
+rev_single_re = re.compile('^('+rev_patt+')$')
+
 def main():
     # Defined as entry point. Must be callable without arguments.
     usage = "svn2svn, version %s\n" % str(full_version) + \
@@ -61,10 +62,8 @@ Display ancestry for a given path in an SVN repository."""
         # Expand multiple "-v" arguments to a real ui._level value
         options.verbosity *= 10
     if options.revision:
-        # Reg-ex for matching a revision arg (http://svnbook.red-bean.com/en/1.5/svn.tour.revs.specifiers.html#svn.tour.revs.dates)
-        rev_patt = '[0-9A-Z]+|\{[0-9A-Za-z/\\ :-]+\}'
         rev = None
-        match = re.match('^('+rev_patt+')$', options.revision)
+        match = rev_single_re.match(options.revision)
         if match is None:
             parser.error("unexpected --revision argument format; see 'svn help log' for valid revision formats")
         rev = match.groups()
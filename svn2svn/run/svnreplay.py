@@ -7,19 +7,21 @@ from svn2svn import ui
 from svn2svn import shell
 from svn2svn import svnclient
 from svn2svn.shell import run_svn,run_shell_command
-from svn2svn.errors import ExternalCommandFailed, UnsupportedSVNAction, InternalError, VerificationError
-from svn2svn.run.common import in_svn, is_child_path, join_path, find_svn_ancestors
+from svn2svn.errors import ExternalCommandFailed, UnsupportedSVNAction, EmptySVNLog, InternalError, VerificationError
+from svn2svn.run.common import in_svn, in_svn_flags, is_child_path, join_path, rebase_path, find_svn_ancestors, clear_ancestor_cache, run_parallel, prefetch_iter, prefetch_wc_status, prefetch_ancestor_logs
 from parse import HelpFormatter
 from breakhandler import BreakHandler
 
 import sys
 import os
 import traceback
-import operator
 import optparse
+import bisect
 import re
 import urllib
-from datetime import datetime
+import errno
+import stat
+import tempfile
 
 # Module-level variables/parameters
 source_url = ""          # URL to source path in source SVN repo, e.g. 'http://server/svn/source/trunk'
@@ -30,20 +32,30 @@ target_url =""           # URL to target path in target SVN repo, e.g. 'file:///
 target_repos_url = ""    # URL to root of target SVN repo,        e.g. 'http://server/svn/target'
 target_base = ""         # Relative path of target_url in target SVN repo, e.g. '/trunk'
 rev_map = {}             # The running mapping-table dictionary for source_url rev #'s -> target_url rev #'s
+rev_map_keys = []        # Sorted list of the source_url rev #'s in rev_map, for get_rev_map()
+rev_map_file = None      # Append-only on-disk copy of rev_map (see open_rev_map_file)
+rev_map_unsynced = 0     # Number of rev_map_file entries written since the last fsync
+source_ancestor_revs = []  # Ascending revision #'s of the source_url ancestors chain, for in_ancestors()
+dirlist_cache = {}       # Cached "svn list" results for source repo dirs, keyed by (url, rev #)
+removed_paths = []       # Paths deleted in the current source revision, removed in one batch
+added_files = []         # Non-copied files added in the current source revision, exported+added in one batch
+created_dirs = set()     # WC folders known to exist in the current source revision, see svn_mkdir()
+modified_dirs = []       # Folders modified (i.e. prop changes) in the current source revision, updated in one batch
 options = None           # optparser options
+rev_map_scan_jobs = 4    # Number of concurrent "svn log" streams build_rev_map() uses on long histories
+rev_map_scan_min = 5000  # Only split build_rev_map()'s scan when checking at least this many target revs
+ancestor_prefetch_jobs = 4  # Number of concurrent "svn log" lookups do_svn_add_dir() uses to trace child ancestry
+
+commit_rev_re = re.compile(r'^Committed revision (\d+)\.', re.M)
+status_unversioned_re = re.compile(r'^\?[ ]+(.+?)[ \r]*$', re.M)   # "?" (unversioned) lines of "svn status"
 
 def parse_svn_commit_rev(output):
     """
     Parse the revision number from the output of "svn commit".
     """
-    output_lines = output.strip(os.linesep).split(os.linesep)
-    rev_num = None
-    for line in output_lines:
-        if line[0:19] == 'Committed revision ':
-            rev_num = line[19:].rstrip('.')
-            break
-    assert rev_num is not None
-    return int(rev_num)
+    m = commit_rev_re.search(output)
+    assert m is not None
+    return int(m.group(1))
 
 def commit_from_svn_log_entry(log_entry, commit_paths=None, target_revprops=None):
     """
@@ -60,10 +72,9 @@ def commit_from_svn_log_entry(log_entry, commit_paths=None, target_revprops=None
         ui.status(">> commit_from_svn_log_entry: Pre-commit wc_target status:", level=ui.EXTRA, color='CYAN')
         ui.status(run_svn(["status"]), level=ui.EXTRA, color='CYAN')
     # This will use the local timezone for displaying commit times
-    timestamp = int(log_entry['date'])
-    svn_date = str(datetime.fromtimestamp(timestamp))
+    svn_date = log_entry['date_str']
     # Uncomment this one one if you prefer UTC commit times
-    #svn_date = "%d 0" % timestamp
+    #svn_date = "%d 0" % int(log_entry['date'])
     args = ["commit", "--force-log"]
     message = log_entry['message']
     if options.log_date:
@@ -71,25 +82,13 @@ def commit_from_svn_log_entry(log_entry, commit_paths=None, target_revprops=None
     if options.log_author:
         message += "\nAuthor: " + log_entry['author']
     args += ["-m", message]
-    revprops = {}
-    if log_entry['revprops']:
-        # Carry forward any revprop's from the source revision
-        for v in log_entry['revprops']:
-            revprops[v['name']] = v['value']
+    # Carry forward any revprop's from the source revision
+    revprops = dict(log_entry['revprops'])
     if target_revprops:
         # Add any extra revprop's we want to set for the target repo commits
-        for v in target_revprops:
-            revprops[v['name']] = v['value']
-    if revprops:
-        for key in revprops:
-            args += ["--with-revprop", "%s=%s" % (key, str(revprops[key]))]
-    if commit_paths:
-        if len(commit_paths)<100:
-            # If we don't have an excessive amount of individual changed paths, pass
-            # those to the "svn commit" command. Else, pass nothing so we commit at
-            # the root of the working-copy.
-            for c_path in commit_paths:
-                args += [svnclient.safe_path(c_path)]
+        revprops.update(target_revprops)
+    for key, value in revprops.iteritems():
+        args.extend(["--with-revprop", "%s=%s" % (key, value)])
     rev_num = None
     if not options.dry_run:
         # Use BreakHandler class to temporarily redirect SIGINT handler, so that
@@ -98,8 +97,28 @@ def commit_from_svn_log_entry(log_entry, commit_paths=None, target_revprops=None
         # has finished raising the KeyboardInterrupt exception.
         bh = BreakHandler()
         bh.enable()
+        targets_path = None
+        if commit_paths:
+            # Pass the changed paths through a "--targets" file rather than on the
+            # command-line, so that however many there are, we can still commit just
+            # those (rather than committing, and crawling, the whole working-copy).
+            fd, targets_path = tempfile.mkstemp(prefix="svn2svn-targets-")
+            f = os.fdopen(fd, "w")
+            for c_path in commit_paths:
+                # svn skips blank lines in a targets file, so spell the WC root
+                # (path_offset '') as "." instead.
+                c_path = svnclient.safe_path(c_path or ".")
+                if isinstance(c_path, unicode):
+                    c_path = c_path.encode(shell.locale_encoding or 'UTF-8')
+                f.write(c_path + "\n")
+            f.close()
+            args += ["--targets", targets_path]
         # Run the "svn commit" command, and screen-scrape the target_rev value (if any)
-        output = run_svn(args)
+        try:
+            output = run_svn(args)
+        finally:
+            if targets_path:
+                os.remove(targets_path)
         rev_num = parse_svn_commit_rev(output) if output else None
         if rev_num is not None:
             if options.keep_date:
@@ -113,62 +132,124 @@ def commit_from_svn_log_entry(log_entry, commit_paths=None, target_revprops=None
             raise KeyboardInterrupt
     return rev_num
 
+def commit_log_entries(log_entries, commit_paths):
+    """
+    Commit the changes replayed from one or more (see --batch-size) source log
+    entries as a single target commit, and map all their source revisions to
+    the resulting target revision.
+    """
+    log_entry = log_entries[-1]
+    if len(log_entries) > 1:
+        log_entry = dict(log_entry)
+        log_entry['message'] = "\n\n".join(["r%s: %s" % (e['revision'], e['message']) for e in log_entries])
+    target_revprops = gen_tracking_revprops(log_entry['revision'])   # Build source-tracking revprop's
+    target_rev = commit_from_svn_log_entry(log_entry, commit_paths, target_revprops=target_revprops)
+    if target_rev:
+        # Update rev_map, mapping table of source-repo rev # -> target-repo rev #
+        for e in log_entries:
+            set_rev_map(e['revision'], target_rev)
+    return target_rev
+
+def is_prop_only_log_entry(log_entry):
+    """
+    Check if a log entry only modifies directories under its source path, i.e.
+    only changes properties (e.g. "record-only" svn:mergeinfo merges). Entries
+    with unknown path kinds (pre-1.6 repos) are never considered property-only.
+    """
+    log_base = log_entry['url'][len(source_repos_url):]
+    found = False
+    for d in log_entry['changed_paths']:
+        if not is_child_path(d.path, log_base):
+            continue
+        if d.action != 'M' or d.kind != 'dir':
+            return False
+        found = True
+    return found
+
 def verify_commit(source_rev, target_rev, log_entry=None):
     """
     Compare the ancestry/content/properties between source_url vs target_url
     for a given revision.
     """
     error_cnt = 0
+    # Neighbouring paths/revisions often ask for the same file-content hash or
+    # property list, so remember those for the length of this verify run.
+    md5_cache = {}
+    props_cache = {}
+    def cat_md5(url, rev, strip_trailing_crlf=False):
+        key = (url, rev, strip_trailing_crlf)
+        if key not in md5_cache:
+            md5_cache[key] = svnclient.cat_md5(url, rev, strip_trailing_crlf)
+        return md5_cache[key]
+    def propget_all(url, rev):
+        key = (url, rev)
+        if key not in props_cache:
+            props = svnclient.propget_all(url, rev)
+            # Ignore "svn:mergeinfo", since we don't copy that
+            props.pop('svn:mergeinfo', None)
+            props_cache[key] = props
+        return props_cache[key]
     # Gather the offsets in the source repo to check
     check_paths = []
+    check_paths_set = set()   # Same as check_paths, for fast membership tests
     remove_paths = []
     # TODO: Need to make this ancestry aware
     if options.verify == 1 and log_entry is not None:  # Changed only
         ui.status("Verifying source revision %s (only-changed)...", source_rev, level=ui.VERBOSE)
+        source_base_prefix = source_base+"/"
         for d in log_entry['changed_paths']:
-            path = d['path']
-            if not is_child_path(path, source_base):
+            path = d.path
+            # i.e. is_child_path(path, source_base)
+            if not (path.startswith(source_base_prefix) or path == source_base):
                 continue
-            if d['kind'] == "":
-                d['kind'] = svnclient.get_kind(source_repos_url, path, source_rev, d['action'], log_entry['changed_paths'])
-            assert (d['kind'] == 'file') or (d['kind'] == 'dir')
-            path_is_dir =  True if d['kind'] == 'dir'  else False
-            path_is_file = True if d['kind'] == 'file' else False
+            if d.kind == "":
+                d.kind = svnclient.get_kind(source_repos_url, path, source_rev, d.action, log_entry['changed_paths'])
+            assert (d.kind == 'file') or (d.kind == 'dir')
+            path_is_dir =  d.kind == 'dir'
+            path_is_file = d.kind == 'file'
             path_offset = path[len(source_base):].strip("/")
-            if d['action'] == 'D':
+            if d.action == 'D':
                 remove_paths.append(path_offset)
-            elif not path_offset in check_paths:
-                ui.status("verify_commit: path [mode=changed]: kind=%s: %s", d['kind'], path, level=ui.DEBUG, color='YELLOW')
+            elif path_offset not in check_paths_set:
+                ui.status("verify_commit: path [mode=changed]: kind=%s: %s", d.kind, path, level=ui.DEBUG, color='YELLOW')
                 if path_is_file:
                     ui.status("  "+"verify_commit [mode=changed]: check_paths.append('%s')", path_offset, level=ui.DEBUG, color='GREEN')
                     check_paths.append(path_offset)
+                    check_paths_set.add(path_offset)
                 if path_is_dir:
-                    if not d['action'] in 'AR':
+                    if d.action not in ('A', 'R'):
                         continue
                     child_paths = svnclient.list(source_url.rstrip("/")+"/"+path_offset, source_rev, recursive=True)
                     for p in child_paths:
-                        child_path_is_dir = True if p['kind'] == 'dir' else False
+                        child_path_is_dir = p['kind'] == 'dir'
                         child_path_offset = p['path']
                         if not child_path_is_dir:
                             # Only check files
                             working_path = (path_offset+"/" if path_offset else "") + child_path_offset
-                            if not working_path in check_paths:
+                            if working_path not in check_paths_set:
                                 ui.status("    "+"verify_commit [mode=changed]: check_paths.append('%s'+'/'+'%s')", path_offset, child_path_offset, level=ui.DEBUG, color='GREEN')
                                 check_paths.append(working_path)
+                                check_paths_set.add(working_path)
     if options.verify == 2:  # All paths
         ui.status("Verifying source revision %s (all)...", source_rev, level=ui.VERBOSE)
-        child_paths = svnclient.list(source_url, source_rev, recursive=True)
+        # Fetch the source and target listings (needed for the "extra" files check
+        # below) concurrently, since these two are the slowest part on big trees.
+        child_paths, target_child_paths = run_parallel([
+            (svnclient.list, (source_url, source_rev, True)),
+            (svnclient.list, (target_url, target_rev, True))])
         for p in child_paths:
-            child_path_is_dir = True if p['kind'] == 'dir' else False
+            child_path_is_dir = p['kind'] == 'dir'
             child_path_offset = p['path']
             if not child_path_is_dir:
                 # Only check files
                 ui.status("verify_commit [mode=all]: check_paths.append('%s')", child_path_offset, level=ui.DEBUG, color='GREEN')
                 check_paths.append(child_path_offset)
+                check_paths_set.add(child_path_offset)
 
     # If there were any paths deleted in the last revision (options.verify=1 mode),
     # check that they were correctly deleted.
     if remove_paths:
+        prefetch_wc_status(remove_paths)
         count_total = len(remove_paths)
         count = 0
         for path_offset in remove_paths:
@@ -182,17 +263,28 @@ def verify_commit(source_rev, target_rev, log_entry=None):
 
     # Compare each of the check_path entries between source vs. target
     if check_paths:
-        source_rev_first = int(min(rev_map, key=rev_map.get)) or 1  # The first source_rev we replayed into target
+        source_rev_first = rev_map_keys[0] or 1  # The first source_rev we replayed into target
         ui.status("verify_commit: source_rev_first:%s", source_rev_first, level=ui.DEBUG, color='YELLOW')
         count_total = len(check_paths)
-        count = 0
-        for path_offset in check_paths:
-            count += 1
+        def verify_path(path_offset, count):
+            """
+            Compare the history of a single check_paths entry. Returns the
+            number of verification errors found, plus this path's ui.status()
+            messages, which are buffered so that concurrent paths don't
+            interleave their output.
+            """
+            messages = []
+            def status(*args, **kwargs):
+                if kwargs.get('level', ui.DEFAULT) <= ui.get_level():
+                    messages.append((args, kwargs))
+            error_cnt = 0
             if count % 500 == 0:
-                ui.status("...processed %s (%s of %s)..." % (count, count, count_total), level=ui.VERBOSE)
-            ui.status("verify_commit: path_offset:%s", path_offset, level=ui.DEBUG, color='YELLOW')
-            source_log_entries = svnclient.run_svn_log(source_url.rstrip("/")+"/"+path_offset, source_rev, 1, source_rev-source_rev_first+1)
-            target_log_entries = svnclient.run_svn_log(target_url.rstrip("/")+"/"+path_offset, target_rev, 1, target_rev)
+                status("...processed %s (%s of %s)..." % (count, count, count_total), level=ui.VERBOSE)
+            status("verify_commit: path_offset:%s", path_offset, level=ui.DEBUG, color='YELLOW')
+            # Stream both logs: we stop reading the source log (and stop "svn log")
+            # as soon as we're past source_rev_first.
+            source_log_entries = svnclient.iter_svn_log(source_url.rstrip("/")+"/"+path_offset, source_rev, 1, source_rev-source_rev_first+1)
+            target_log_entries = svnclient.iter_svn_log(target_url.rstrip("/")+"/"+path_offset, target_rev, 1, target_rev)
             # Build a list of commits in source_log_entries which matches our
             # target path_offset.
             working_path = source_base+"/"+path_offset
@@ -202,100 +294,90 @@ def verify_commit(source_rev, target_rev, log_entry=None):
                 if source_rev_tmp < source_rev_first:
                     # Only process source revisions which have been replayed into target
                     break
-                #ui.status("  [verify_commit] source_rev_tmp:%s, working_path:%s\n%s", source_rev_tmp, working_path, pp.pformat(log_entry), level=ui.DEBUG, color='MAGENTA')
-                changed_paths_temp = []
+                #status("  [verify_commit] source_rev_tmp:%s, working_path:%s\n%s", source_rev_tmp, working_path, pp.pformat(log_entry), level=ui.DEBUG, color='MAGENTA')
+                # Find the action for our working_path in this revision: the most-granular
+                # (deepest in the tree) matching path, unless working_path or a parent
+                # folder was added/replaced as a copy, in which case take the deepest
+                # such copy-from. Only the deepest entries matter, so there's no need
+                # to sort the matches.
+                match_d = None
+                copy_d = None
                 for d in log_entry['changed_paths']:
-                    path = d['path']
-                    # Match working_path or any parents
-                    if is_child_path(working_path, path):
-                        ui.status("  verify_commit: changed_path: %s %s@%s (parent:%s)", d['action'], path, source_rev_tmp, working_path, level=ui.DEBUG, color='YELLOW')
-                        changed_paths_temp.append({'path': path, 'data': d})
-                assert changed_paths_temp
-                # Reverse-sort any matches, so that we start with the most-granular (deepest in the tree) path.
-                changed_paths = sorted(changed_paths_temp, key=operator.itemgetter('path'), reverse=True)
-                # Find the action for our working_path in this revision. Use a loop to check in reverse order,
-                # so that if the target file/folder is "M" but has a parent folder with an "A" copy-from.
+                    path = d.path
+                    # Match working_path or any parents (i.e. is_child_path(working_path, path),
+                    # inlined since this runs for every changed path of every revision)
+                    if working_path == path or working_path.startswith(path+"/"):
+                        status("  verify_commit: changed_path: %s %s@%s (parent:%s)", d.action, path, source_rev_tmp, working_path, level=ui.DEBUG, color='YELLOW')
+                        if d.action not in svnclient.valid_svn_actions:
+                            raise UnsupportedSVNAction("In SVN rev. %d: action '%s' not supported. Please report a bug!"
+                                % (log_entry['revision'], d.action))
+                        if match_d is None or len(path) > len(match_d.path):
+                            match_d = d
+                        if d.action in ('A', 'R') and d.copyfrom_revision and \
+                                (copy_d is None or len(path) > len(copy_d.path)):
+                            copy_d = d
+                assert match_d is not None
                 working_path_next = working_path
-                match_d = {}
-                for v in changed_paths:
-                    d = v['data']
-                    if not match_d:
-                        match_d = d
-                    path = d['path']
-                    if d['action'] not in svnclient.valid_svn_actions:
-                        raise UnsupportedSVNAction("In SVN rev. %d: action '%s' not supported. Please report a bug!"
-                            % (log_entry['revision'], d['action']))
-                    if d['action'] in 'AR' and d['copyfrom_revision']:
-                        # If we found a copy-from action for a parent path, adjust our
-                        # working_path to follow the rename/copy-from, just like find_svn_ancestors().
-                        working_path_next = working_path.replace(d['path'], d['copyfrom_path'])
-                        match_d = d
-                        break
+                if copy_d is not None:
+                    # If we found a copy-from action for a parent path, adjust our
+                    # working_path to follow the rename/copy-from, just like find_svn_ancestors().
+                    working_path_next = rebase_path(working_path, copy_d.path, copy_d.copyfrom_path)
+                    match_d = copy_d
                 if is_child_path(working_path, source_base):
                     # Only add source_rev's where the path changed in this revision was a child
                     # of source_base, so that we silently ignore any history that happened on
                     # non-source_base paths (e.g. ignore branch history if we're only replaying trunk).
                     is_diff = False
                     d = match_d
-                    if d['action'] == 'M':
+                    if d.action == 'M':
                         # For action="M", we need to throw out cases where the only change was to
                         # a property which we ignore, e.g. "svn:mergeinfo".
-                        if d['kind'] == "":
-                            d['kind'] = svnclient.get_kind(source_repos_url, working_path, log_entry['revision'], d['action'], log_entry['changed_paths'])
-                        assert (d['kind'] == 'file') or (d['kind'] == 'dir')
-                        if d['kind'] == 'file':
+                        if d.kind == "":
+                            d.kind = svnclient.get_kind(source_repos_url, working_path, log_entry['revision'], d.action, log_entry['changed_paths'])
+                        assert (d.kind == 'file') or (d.kind == 'dir')
+                        if d.kind == 'file':
                             # Check for file-content changes
                             # TODO: This should be made ancestor-aware, since the file won't always be at the same path in rev-1
-                            sum1 = run_shell_command("svn cat -r %s '%s' | md5sum" % (source_rev_tmp, source_repos_url+working_path+"@"+str(source_rev_tmp)))
-                            sum2 = run_shell_command("svn cat -r %s '%s' | md5sum" % (source_rev_tmp-1, source_repos_url+working_path_next+"@"+str(source_rev_tmp-1)))
-                            is_diff = True if sum1 <> sum2 else False
+                            sum1 = cat_md5(source_repos_url+working_path, source_rev_tmp)
+                            sum2 = cat_md5(source_repos_url+working_path_next, source_rev_tmp-1)
+                            is_diff = sum1 != sum2
                         if not is_diff:
                             # Check for property changes
-                            props1 = svnclient.propget_all(source_repos_url+working_path, source_rev_tmp)
-                            props2 = svnclient.propget_all(source_repos_url+working_path_next, source_rev_tmp-1)
-                            # Ignore changes to "svn:mergeinfo", since we don't copy that
-                            if 'svn:mergeinfo' in props1: del props1['svn:mergeinfo']
-                            if 'svn:mergeinfo' in props2: del props2['svn:mergeinfo']
-                            for prop in props1:
-                                if prop not in props2 or \
-                                        props1[prop] != props2[prop]:
-                                    is_diff = True
-                                    break
-                            for prop in props2:
-                                if prop not in props1 or \
-                                        props1[prop] != props2[prop]:
-                                    is_diff = True
-                                    break
+                            props1 = propget_all(source_repos_url+working_path, source_rev_tmp)
+                            props2 = propget_all(source_repos_url+working_path_next, source_rev_tmp-1)
+                            # (svn:mergeinfo is already left out by propget_all())
+                            is_diff = props1 != props2
                         if not is_diff:
-                            ui.status("  verify_commit: skip %s@%s", working_path, source_rev_tmp, level=ui.DEBUG, color='GREEN_B', bold=True)
+                            status("  verify_commit: skip %s@%s", working_path, source_rev_tmp, level=ui.DEBUG, color='GREEN_B', bold=True)
                     else:
                         is_diff = True
                     if is_diff:
-                        ui.status("  verify_commit: source_revs.append(%s), working_path:%s", source_rev_tmp, working_path, level=ui.DEBUG, color='GREEN_B')
+                        status("  verify_commit: source_revs.append(%s), working_path:%s", source_rev_tmp, working_path, level=ui.DEBUG, color='GREEN_B')
                         source_revs.append({'path': working_path, 'revision': source_rev_tmp})
                 working_path = working_path_next
+            source_log_entries.close()
             # Build a list of all the target commits "svn log" returned
             target_revs = []
             target_revs_rmndr = []
             for log_entry in target_log_entries:
                 target_rev_tmp = log_entry['revision']
-                ui.status("  verify_commit: target_revs.append(%s)", target_rev_tmp, level=ui.DEBUG, color='GREEN_B')
+                status("  verify_commit: target_revs.append(%s)", target_rev_tmp, level=ui.DEBUG, color='GREEN_B')
                 target_revs.append(target_rev_tmp)
                 target_revs_rmndr.append(target_rev_tmp)
             # Compare the two lists
             for d in source_revs:
                 working_path   = d['path']
                 source_rev_tmp = d['revision']
-                target_rev_tmp = get_rev_map(source_rev_tmp, "  ")
+                target_rev_tmp = get_rev_map(source_rev_tmp, depth=1, status=status)
                 working_offset = working_path[len(source_base):].strip("/")
-                sum1 = run_shell_command("svn cat -r %s '%s' | md5sum" % (source_rev_tmp, source_repos_url+working_path+"@"+str(source_rev_tmp)))
-                sum2 = run_shell_command("svn cat -r %s '%s' | md5sum" % (target_rev_tmp, target_url+"/"+working_offset+"@"+str(target_rev_tmp))) if target_rev_tmp is not None else ""
+                sum1 = cat_md5(source_repos_url+working_path, source_rev_tmp)
+                sum2 = cat_md5(target_url+"/"+working_offset, target_rev_tmp) if target_rev_tmp is not None else ""
                 #print "source@%s: %s" % (str(source_rev_tmp).ljust(6), sum1)
                 #print "target@%s: %s" % (str(target_rev_tmp).ljust(6), sum2)
-                ui.status("  verify_commit: %s: source=%s target=%s", working_offset, source_rev_tmp, target_rev_tmp, level=ui.DEBUG, color='GREEN')
+                status("  verify_commit: %s: source=%s target=%s", working_offset, source_rev_tmp, target_rev_tmp, level=ui.DEBUG, color='GREEN')
                 if not target_rev_tmp:
-                    ui.status(" (%s/%s) Verify path: FAIL: %s", str(count).rjust(len(str(count_total))), count_total, path_offset, level=ui.EXTRA, color='RED')
-                    ui.status("VerificationError: Unable to find corresponding target_rev for source_rev r%s in rev_map (path_offset='%s')", source_rev_tmp, path_offset, color='RED')
+                    status(" (%s/%s) Verify path: FAIL: %s", str(count).rjust(len(str(count_total))), count_total, path_offset, level=ui.EXTRA, color='RED')
+                    status("VerificationError: Unable to find corresponding target_rev for source_rev r%s in rev_map (path_offset='%s')", source_rev_tmp, path_offset, color='RED')
                     error_cnt +=1
                     continue
                 if target_rev_tmp not in target_revs:
@@ -304,38 +386,48 @@ def verify_commit(source_rev, target_rev, log_entry=None):
                     # removal/addition of a trailing newline char, since this seems to get
                     # stripped-out sometimes during the replay (via "svn export"?).
                     # Strip any trailing \r\n from file-content (http://stackoverflow.com/a/1656218/346778)
-                    sum1 = run_shell_command("svn cat -r %s '%s' | perl -i -p0777we's/\\r\\n\z//' | md5sum" % (source_rev_tmp,   source_repos_url+working_path+"@"+str(source_rev_tmp)))
-                    sum2 = run_shell_command("svn cat -r %s '%s' | perl -i -p0777we's/\\r\\n\z//' | md5sum" % (source_rev_tmp-1, source_repos_url+working_path+"@"+str(source_rev_tmp-1)))
-                    if sum1 <> sum2:
-                        ui.status(" (%s/%s) Verify path: FAIL: %s", str(count).rjust(len(str(count_total))), count_total, path_offset, level=ui.EXTRA, color='RED')
-                        ui.status("VerificationError: Found source_rev (r%s) with no corresponding target_rev: path_offset='%s'", source_rev_tmp, path_offset, color='RED')
+                    sum1 = cat_md5(source_repos_url+working_path, source_rev_tmp,   strip_trailing_crlf=True)
+                    sum2 = cat_md5(source_repos_url+working_path, source_rev_tmp-1, strip_trailing_crlf=True)
+                    if sum1 != sum2:
+                        status(" (%s/%s) Verify path: FAIL: %s", str(count).rjust(len(str(count_total))), count_total, path_offset, level=ui.EXTRA, color='RED')
+                        status("VerificationError: Found source_rev (r%s) with no corresponding target_rev: path_offset='%s'", source_rev_tmp, path_offset, color='RED')
                         error_cnt +=1
                     continue
                 target_revs_rmndr.remove(target_rev_tmp)
             if target_revs_rmndr:
                 rmndr_list = ", ".join(map(str, target_revs_rmndr))
-                ui.status(" (%s/%s) Verify path: FAIL: %s", str(count).rjust(len(str(count_total))), count_total, path_offset, level=ui.EXTRA, color='RED')
-                ui.status("VerificationError: Found one or more *extra* target_revs: path_offset='%s', target_revs='%s'", path_offset, rmndr_list, color='RED')
+                status(" (%s/%s) Verify path: FAIL: %s", str(count).rjust(len(str(count_total))), count_total, path_offset, level=ui.EXTRA, color='RED')
+                status("VerificationError: Found one or more *extra* target_revs: path_offset='%s', target_revs='%s'", path_offset, rmndr_list, color='RED')
                 error_cnt +=1
             else:
-                ui.status(" (%s/%s) Verify path: OK: %s", str(count).rjust(len(str(count_total))), count_total, path_offset, level=ui.EXTRA)
+                status(" (%s/%s) Verify path: OK: %s", str(count).rjust(len(str(count_total))), count_total, path_offset, level=ui.EXTRA)
+            return error_cnt, messages
+        # Paths are independent of each other, and each one costs several svn
+        # round-trips, so check several of them at once.
+        results = run_parallel([(verify_path, (path_offset, i+1))
+                                for i, path_offset in enumerate(check_paths)],
+                               max_threads=options.verify_jobs)
+        for path_error_cnt, messages in results:
+            for args, kwargs in messages:
+                ui.status(*args, **kwargs)
+            error_cnt += path_error_cnt
 
     # Ensure there are no "extra" files in the target side
     if options.verify == 2:
         target_paths = []
-        child_paths = svnclient.list(target_url, target_rev, recursive=True)
-        for p in child_paths:
-            child_path_is_dir = True if p['kind'] == 'dir' else False
+        for p in target_child_paths:
+            child_path_is_dir = p['kind'] == 'dir'
             child_path_offset = p['path']
             if not child_path_is_dir:
                 target_paths.append(child_path_offset)
         # Compare
+        target_paths_set = set(target_paths)
         for path_offset in target_paths:
-            if not path_offset in check_paths:
+            if path_offset not in check_paths_set:
                 ui.status("VerificationError: Path exists in target (@%s) but not source (@%s): %s", target_rev, source_rev, path_offset, color='RED')
                 error_cnt += 1
         for path_offset in check_paths:
-            if not path_offset in target_paths:
+            if path_offset not in target_paths_set:
                 ui.status("VerificationError: Path exists in source (@%s) but not target (@%s): %s", source_rev, target_rev, path_offset, color='RED')
                 error_cnt += 1
 
@@ -349,24 +441,36 @@ def full_svn_revert():
     """
     run_svn(["revert", "--recursive", "."])
     output = run_svn(["status"])
-    if output:
-        output_lines = output.strip(os.linesep).split(os.linesep)
-        for line in output_lines:
-            if line[0] == "?":
-                path = line[4:].strip(" ")
-                if os.path.isfile(path):
-                    os.remove(path)
-                if os.path.isdir(path):
-                    shell.rmtree(path)
+    for path in status_unversioned_re.findall(output):
+        try:
+            mode = os.lstat(path).st_mode
+        except OSError, e:
+            if e.errno == errno.ENOENT:
+                continue
+            raise
+        if stat.S_ISDIR(mode):
+            shell.rmtree(path)
+        else:
+            os.remove(path)
+
+def cleanup_wc(show_status=False):
+    """
+    Return the working copy to a clean, committable state: clear any stale
+    locks ("svn cleanup") and throw away any uncommitted changes. If
+    'show_status', first display the pending changes being thrown away.
+    """
+    run_svn(["cleanup"])
+    if show_status:
+        print run_svn(["status"])
+    full_svn_revert()
 
 def gen_tracking_revprops(source_rev):
     """
-    Build an array of svn2svn-specific source-tracking revprops.
+    Build a dict of svn2svn-specific source-tracking revprops.
     """
-    revprops = [{'name':'svn2svn:source_uuid', 'value':source_repos_uuid},
-                {'name':'svn2svn:source_url',  'value':urllib.quote(source_url, ":/")},
-                {'name':'svn2svn:source_rev',  'value':source_rev}]
-    return revprops
+    return {'svn2svn:source_uuid': source_repos_uuid,
+            'svn2svn:source_url':  urllib.quote(source_url, ":/"),
+            'svn2svn:source_rev':  source_rev}
 
 def sync_svn_props(source_url, source_rev, path_offset):
     """
@@ -389,72 +493,260 @@ def sync_svn_props(source_url, source_rev, path_offset):
             # whose value differs between source vs. target.
             run_svn(["propset", prop, source_props[prop], svnclient.safe_path(path_offset)])
 
-def get_rev_map(source_rev, prefix):
+def get_rev_map(source_rev, depth=0, status=ui.status):
     """
     Find the equivalent rev # in the target repo for the given rev # from the source repo.
+    Debug output goes through 'status' (e.g. verify_commit()'s per-path buffer).
     """
-    ui.status(prefix + ">> get_rev_map(%s)", source_rev, level=ui.DEBUG, color='GREEN')
     # Find the highest entry less-than-or-equal-to source_rev
-    for rev in range(int(source_rev), 0, -1):
-        in_rev_map = True if rev in rev_map else False
-        ui.status(prefix + ">> get_rev_map: rev=%s  in_rev_map=%s", rev, str(in_rev_map), level=ui.DEBUG, color='BLACK_B')
-        if in_rev_map:
-            return int(rev_map[rev])
-    # Else, we fell off the bottom of the rev_map. Ruh-roh...
-    return None
+    idx = bisect.bisect_right(rev_map_keys, int(source_rev))
+    if idx == 0:
+        # We fell off the bottom of the rev_map. Ruh-roh...
+        status(">> get_rev_map(%s): no match", source_rev, level=ui.DEBUG, indent=depth, color='GREEN')
+        return None
+    rev = rev_map_keys[idx-1]
+    status(">> get_rev_map(%s): matched r%s", source_rev, rev, level=ui.DEBUG, indent=depth, color='GREEN')
+    return rev_map[rev]
 
 def set_rev_map(source_rev, target_rev):
     #ui.status(">> set_rev_map: source_rev=%s target_rev=%s", source_rev, target_rev, level=ui.DEBUG, color='GREEN')
-    global rev_map
-    rev_map[int(source_rev)]=int(target_rev)
+    global rev_map, rev_map_unsynced
+    # rev_map keys and values are always int's, so readers don't need to coerce them.
+    source_rev = int(source_rev)
+    target_rev = int(target_rev)
+    if source_rev not in rev_map:
+        bisect.insort(rev_map_keys, source_rev)
+    rev_map[source_rev] = target_rev
+    if rev_map_file:
+        rev_map_file.write("%s %s\n" % (source_rev, target_rev))
+        rev_map_file.flush()
+        rev_map_unsynced += 1
+        if rev_map_unsynced >= 100:
+            os.fsync(rev_map_file.fileno())
+            rev_map_unsynced = 0
 
-def build_rev_map(target_url, target_end_rev, source_info):
+def open_rev_map_file(path, source_info, load=False):
+    """
+    Open the append-only rev_map file at 'path', which every set_rev_map() call
+    is appended to. If 'load', first read any existing entries into rev_map
+    (as long as the file belongs to the same source_url). Returns the highest
+    target_rev found in the file (or 0), i.e. where build_rev_map() can resume
+    from. Besides "source_rev target_rev" entries, the file can contain "# tip N"
+    lines, marking that build_rev_map() already checked target revisions up to N.
+    """
+    global rev_map_file
+    header = "# svn2svn rev_map: %s %s\n" % (source_info['repos_uuid'], urllib.quote(source_info['url'], ":/"))
+    target_rev_max = 0
+    if load and os.path.exists(path):
+        f = open(path, 'r')
+        lines = f.readlines()
+        f.close()
+        if lines and lines[0] == header:
+            for line in lines[1:]:
+                fields = line.split()
+                if line.startswith("#"):
+                    if len(fields) == 3 and fields[1] == "tip" and fields[2].isdigit():
+                        target_rev_max = max(target_rev_max, int(fields[2]))
+                    continue
+                if len(fields) != 2:
+                    # Partially-written last line, e.g. after a crash
+                    continue
+                source_rev, target_rev = int(fields[0]), int(fields[1])
+                rev_map[source_rev] = target_rev
+                target_rev_max = max(target_rev_max, target_rev)
+        rev_map_keys[:] = sorted(rev_map)
+    # (Re-)write the file, dropping any partially-written trailing line
+    rev_map_file = open(path, 'w')
+    rev_map_file.write(header)
+    for source_rev in sorted(rev_map):
+        rev_map_file.write("%s %s\n" % (source_rev, rev_map[source_rev]))
+    if target_rev_max:
+        rev_map_file.write("# tip %s\n" % target_rev_max)
+    rev_map_file.flush()
+    return target_rev_max
+
+def close_rev_map_file():
+    global rev_map_file
+    if rev_map_file:
+        rev_map_file.flush()
+        os.fsync(rev_map_file.fileno())
+        rev_map_file.close()
+        rev_map_file = None
+
+def build_rev_map(target_url, target_end_rev, source_info, target_start_rev=1):
     """
     Check for any already-replayed history from source_url (source_info) and
-    build the mapping-table of source_rev -> target_rev.
+    build the mapping-table of source_rev -> target_rev. Only target revisions
+    from target_start_rev onwards are checked, so that we can pick-up from an
+    already-loaded rev_map file.
     """
-    global rev_map
-    rev_map = {}
     ui.status("Rebuilding target_rev -> source_rev rev_map...", level=ui.VERBOSE)
+    if target_start_rev > target_end_rev:
+        return
     proc_count = 0
-    it_log_entries = svnclient.iter_svn_log_entries(target_url, 1, target_end_rev, get_changed_paths=False, get_revprops=True)
-    for log_entry in it_log_entries:
-        if log_entry['revprops']:
-            revprops = {}
-            for v in log_entry['revprops']:
-                if v['name'].startswith('svn2svn:'):
-                    revprops[v['name']] = v['value']
-            if revprops and \
-               revprops['svn2svn:source_uuid'] == source_info['repos_uuid'] and \
-               revprops['svn2svn:source_url'] == urllib.quote(source_info['url'], ":/"):
-                source_rev = revprops['svn2svn:source_rev']
-                target_rev = log_entry['revision']
-                set_rev_map(source_rev, target_rev)
-                proc_count += 1
-                if proc_count % 500 == 0:
-                    ui.status("...processed %s (%s of %s)..." % (proc_count, target_rev, target_end_rev), level=ui.VERBOSE)
+    source_uuid = source_info['repos_uuid']
+    source_url_quoted = urllib.quote(source_info['url'], ":/")
+    # Only fetch the svn2svn:* revprops: this scans (potentially) the whole
+    # target_url history, so skip transferring every log message/author/date.
+    revprop_names = ['svn2svn:source_uuid', 'svn2svn:source_url', 'svn2svn:source_rev']
+    def scan_range(rev_start, rev_end):
+        """
+        Return the (source_rev, target_rev) pairs for the target revisions in
+        rev_start:rev_end which were replayed from source_url.
+        """
+        pairs = []
+        # Peg every range at target_end_rev, so that each range follows the same
+        # line of history that a single "svn log" over the whole range would.
+        for log_entry in svnclient.iter_svn_log(target_url, rev_start, rev_end, get_changed_paths=False,
+                                                get_revprops=revprop_names, peg_rev=target_end_rev):
+            revprops = log_entry['revprops']
+            source_rev = revprops.get('svn2svn:source_rev')
+            if source_rev is not None:
+                if revprops.get('svn2svn:source_uuid') == source_uuid and \
+                   revprops.get('svn2svn:source_url') == source_url_quoted:
+                    pairs.append((source_rev, log_entry['revision']))
+        return pairs
+    if target_start_rev == 1:
+        # Don't ask for revisions from before target_url's history starts.
+        target_start_rev = svnclient.get_first_svn_log_entry(target_url, 1, target_end_rev,
+            stop_on_copy=False, get_changed_paths=False)['revision']
+    # On long histories, split the range into a few pieces and scan those with
+    # concurrent "svn log" calls.
+    num_ranges = rev_map_scan_jobs if target_end_rev-target_start_rev+1 >= rev_map_scan_min else 1
+    range_length = (target_end_rev-target_start_rev+1 + num_ranges-1) // num_ranges
+    ranges = [(rev, min(rev+range_length-1, target_end_rev))
+              for rev in range(target_start_rev, target_end_rev+1, range_length)]
+    for pairs in run_parallel([(scan_range, r) for r in ranges]):
+        for source_rev, target_rev in pairs:
+            set_rev_map(source_rev, target_rev)
+            proc_count += 1
+            if proc_count % 500 == 0:
+                ui.status("...processed %s (%s of %s)..." % (proc_count, target_rev, target_end_rev), level=ui.VERBOSE)
+    if rev_map_file:
+        # Remember how far we've checked, so the next continue-mode run doesn't need
+        # to re-check any trailing non-replayed target revisions (e.g. --keep-revnum padding).
+        rev_map_file.write("# tip %s\n" % target_end_rev)
+        rev_map_file.flush()
+
+def _sorted_contains(paths, path):
+    i = bisect.bisect_left(paths, path)
+    return i < len(paths) and paths[i] == path
 
 def path_in_list(paths, path):
-    for p in paths:
-        if is_child_path(path, p):
+    """
+    Return True if 'path' (or any of its parent paths) is in 'paths', which
+    must be a sorted list as maintained by add_path(). The WC root '' is the
+    parent of every path.
+    """
+    if _sorted_contains(paths, path):
+        return True
+    if paths and paths[0] == '':
+        return True
+    idx = path.rfind("/")
+    while idx > 0:
+        if _sorted_contains(paths, path[:idx]):
             return True
+        idx = path.rfind("/", 0, idx)
     return False
 
 def add_path(paths, path):
-    if not path_in_list(paths, path):
-        paths.append(path)
+    """
+    Add 'path' to the sorted list 'paths', unless it's already covered by
+    an existing parent path. Any existing child paths of 'path' are dropped,
+    so 'paths' always stays a minimal set of covering paths.
+    """
+    if path_in_list(paths, path):
+        return
+    if path == '':
+        # The WC root covers everything
+        paths[:] = ['']
+        return
+    # All children of 'path' sort contiguously between path+"/" and path+"0"
+    start = bisect.bisect_left(paths, path+"/")
+    end = bisect.bisect_left(paths, path+"0", start)
+    paths[start:end] = []
+    bisect.insort(paths, path)
+
+def svn_mkdir(p_path):
+    """
+    "svn mkdir" a (parent) folder in the WC, if it doesn't already exist. Remember
+    folders which are known to exist, along with all their parent folders, so that
+    adding many paths under the same folder doesn't re-check it every time.
+    Returns True if we ran "svn mkdir", i.e. p_path is now (newly) under
+    version-control.
+    """
+    if p_path in created_dirs:
+        return False
+    made = False
+    if not os.path.exists(p_path):
+        run_svn(["mkdir", svnclient.safe_path(p_path)])
+        made = True
+    while p_path and p_path not in created_dirs:
+        created_dirs.add(p_path)
+        p_path = os.path.dirname(p_path)
+    return made
 
-def in_ancestors(ancestors, ancestor):
-    match = True
-    for idx in range(len(ancestors)-1, 0, -1):
-        if int(ancestors[idx]['revision']) > ancestor['revision']:
-            match = is_child_path(ancestor['path'], ancestors[idx]['path'])
-            break
-    return match
+def in_ancestors(ancestors, ancestor_revs, ancestor):
+    """
+    Check that 'ancestor' lies on the 'ancestors' chain: find the oldest entry
+    of 'ancestors' (excluding the newest one) which is newer than 'ancestor',
+    and check that 'ancestor' is a child of that entry's path. 'ancestor_revs'
+    is the ascending list of revision #'s of 'ancestors' (excluding the newest
+    one), built once by the caller rather than on every call.
+    """
+    k = bisect.bisect_right(ancestor_revs, ancestor['revision'])
+    if k == len(ancestor_revs):
+        return True
+    return is_child_path(ancestor['path'], ancestors[len(ancestors)-1-k]['path'])
+
+def get_svn_dirlist(svn_url, rev_number):
+    """
+    List the contents of a directory in the source repo, like svnclient.list().
+    The first lookup for a given directory does a single recursive "svn list"
+    and caches the listing of every sub-directory under it, so that recursive
+    descents (do_svn_add_dir) don't need one "svn list" call per directory.
+    """
+    key = (svn_url, rev_number)
+    if key not in dirlist_cache:
+        dirlist_cache[key] = []
+        for p in svnclient.list(svn_url, rev_number, recursive=True):
+            parent, sep, name = p['path'].rpartition('/')
+            if p['kind'] == 'dir':
+                dirlist_cache.setdefault((join_path(svn_url, p['path']), rev_number), [])
+            dirlist_cache.setdefault((join_path(svn_url, parent), rev_number), []).append(
+                {'path': name, 'kind': p['kind']})
+    return dirlist_cache[key]
+
+def coalesce_export_paths(source_url, source_rev, paths):
+    """
+    Replace any group of (non-overlapping) export paths which covers every entry
+    of their parent folder with a single export of that parent folder, repeating
+    up the tree. Only already-cached "svn list" results (see get_svn_dirlist) are
+    used, so this never costs an extra svn command.
+    """
+    paths = list(paths)
+    while True:
+        siblings = {}
+        for p in paths:
+            parent, sep, name = p.rpartition('/')
+            if parent:
+                siblings.setdefault(parent, set()).add(name)
+        merged = []
+        for parent, names in siblings.iteritems():
+            if len(names) < 2:
+                continue
+            listing = dirlist_cache.get((join_path(source_url, parent), source_rev))
+            if listing is not None and len(listing) == len(names) and \
+               all(e['path'] in names for e in listing):
+                merged.append(parent)
+        if not merged:
+            return paths
+        paths = [p for p in paths if p.rpartition('/')[0] not in merged] + merged
 
 def do_svn_add(source_url, path_offset, source_rev, source_ancestors, \
                parent_copyfrom_path="", parent_copyfrom_rev="", \
-               export_paths={}, is_dir = False, skip_paths=[], prefix = ""):
+               export_paths={}, is_dir = False, skip_paths=[], depth=0, \
+               known_copyfrom=None):
     """
     Given the add'd source path, replay the "svn add/copy" commands to correctly
     track renames across copy-from's.
@@ -478,48 +770,63 @@ def do_svn_add(source_url, path_offset, source_rev, source_ancestors, \
       directory, when being called recursively by do_svn_add_dir().
     'export_paths' is the list of path_offset's that we've deferred running "svn export" on.
     'is_dir' is whether path_offset is a directory (rather than a file).
+    'known_copyfrom' is an optional (copyfrom_path, copyfrom_rev) pair, when the caller
+      already knows the copy-from info for path_offset@source_rev from the log entry.
     """
     source_base = source_url[len(source_repos_url):]  # e.g. '/trunk'
-    ui.status(prefix + ">> do_svn_add: %s  %s", join_path(source_base, path_offset)+"@"+str(source_rev),
-        "  (parent-copyfrom: "+parent_copyfrom_path+"@"+str(parent_copyfrom_rev)+")" if parent_copyfrom_path else "",
-        level=ui.DEBUG, color='GREEN')
+    source_path = join_path(source_base, path_offset)  # e.g. '/trunk/projectA/file1.txt'
+    debug = ui.get_level() >= ui.DEBUG
+    if debug:
+        ui.status(">> do_svn_add: %s  %s", source_path+"@"+str(source_rev),
+            "  (parent-copyfrom: "+parent_copyfrom_path+"@"+str(parent_copyfrom_rev)+")" if parent_copyfrom_path else "",
+            level=ui.DEBUG, indent=depth, color='GREEN')
     # Check if the given path has ancestors which chain back to the current source_base
     found_ancestor = False
-    ancestors = find_svn_ancestors(source_repos_url, join_path(source_base, path_offset), source_rev, stop_base_path=source_base, prefix=prefix+"  ")
-    ancestor = ancestors[len(ancestors)-1] if ancestors else None  # Choose the eldest ancestor, i.e. where we reached stop_base_path=source_base
-    if ancestor and not in_ancestors(source_ancestors, ancestor):
+    if known_copyfrom and is_child_path(known_copyfrom[0], source_base):
+        # If this path was copied from somewhere inside source_base, then the
+        # ancestry-chain is just that one copy-from, so there's no need to walk
+        # the "svn log" history in find_svn_ancestors().
+        ancestors = [{'path': source_path, 'revision': source_rev,
+                      'copyfrom_path': known_copyfrom[0], 'copyfrom_rev': known_copyfrom[1]}]
+    else:
+        ancestors = find_svn_ancestors(source_repos_url, source_path, source_rev, stop_base_path=source_base, depth=depth+1)
+    ancestor = ancestors[-1] if ancestors else None  # Choose the eldest ancestor, i.e. where we reached stop_base_path=source_base
+    if ancestor and not in_ancestors(source_ancestors, source_ancestor_revs, ancestor):
         ancestor = None
     copyfrom_path = ancestor['copyfrom_path'] if ancestor else ""
     copyfrom_rev  = ancestor['copyfrom_rev']  if ancestor else ""
     if ancestor:
         # The copy-from path has ancestry back to source_url.
-        ui.status(prefix + ">> do_svn_add: Check copy-from: Found parent: %s", copyfrom_path+"@"+str(copyfrom_rev),
-            level=ui.DEBUG, color='GREEN', bold=True)
+        if debug:
+            ui.status(">> do_svn_add: Check copy-from: Found parent: %s", copyfrom_path+"@"+str(copyfrom_rev),
+                level=ui.DEBUG, indent=depth, color='GREEN', bold=True)
         found_ancestor = True
         # Map the copyfrom_rev (source repo) to the equivalent target repo rev #. This can
         # return None in the case where copyfrom_rev is *before* our source_start_rev.
-        tgt_rev = get_rev_map(copyfrom_rev, prefix+"  ")
-        ui.status(prefix + ">> do_svn_add: get_rev_map: %s (source) -> %s (target)", copyfrom_rev, tgt_rev, level=ui.DEBUG, color='GREEN')
+        tgt_rev = get_rev_map(copyfrom_rev, depth+1)
+        ui.status(">> do_svn_add: get_rev_map: %s (source) -> %s (target)", copyfrom_rev, tgt_rev, level=ui.DEBUG, indent=depth, color='GREEN')
     else:
-        ui.status(prefix + ">> do_svn_add: Check copy-from: No ancestor chain found.", level=ui.DEBUG, color='GREEN')
+        ui.status(">> do_svn_add: Check copy-from: No ancestor chain found.", level=ui.DEBUG, indent=depth, color='GREEN')
         found_ancestor = False
     if found_ancestor and tgt_rev:
         # Check if this path_offset in the target WC already has this ancestry, in which
         # case there's no need to run the "svn copy" (again).
-        path_in_svn = in_svn(path_offset, prefix=prefix+"  ")
-        log_entry = svnclient.get_last_svn_log_entry(path_offset, 1, 'HEAD', get_changed_paths=False) if in_svn(path_offset, require_in_repo=True, prefix=prefix+"  ") else []
+        path_in_svn, path_in_repo = in_svn_flags(path_offset, depth=depth+1)
+        log_entry = svnclient.get_last_svn_log_entry(path_offset, 1, 'HEAD', get_changed_paths=False) if path_in_repo else []
         if (not log_entry or (log_entry['revision'] != tgt_rev)):
             copyfrom_offset = copyfrom_path[len(source_base):].strip('/')
-            ui.status(prefix + ">> do_svn_add: svn_copy: Copy-from: %s", copyfrom_path+"@"+str(copyfrom_rev), level=ui.DEBUG, color='GREEN')
-            ui.status(prefix + "   copyfrom: %s", copyfrom_path+"@"+str(copyfrom_rev), level=ui.DEBUG, color='GREEN')
-            ui.status(prefix + " p_copyfrom: %s", parent_copyfrom_path+"@"+str(parent_copyfrom_rev) if parent_copyfrom_path else "", level=ui.DEBUG, color='GREEN')
+            if debug:
+                ui.status(">> do_svn_add: svn_copy: Copy-from: %s", copyfrom_path+"@"+str(copyfrom_rev), level=ui.DEBUG, indent=depth, color='GREEN')
+                ui.status("   copyfrom: %s", copyfrom_path+"@"+str(copyfrom_rev), level=ui.DEBUG, indent=depth, color='GREEN')
+                ui.status(" p_copyfrom: %s", parent_copyfrom_path+"@"+str(parent_copyfrom_rev) if parent_copyfrom_path else "", level=ui.DEBUG, indent=depth, color='GREEN')
             if path_in_svn and \
                ((parent_copyfrom_path and is_child_path(copyfrom_path, parent_copyfrom_path)) and \
                 (parent_copyfrom_rev and copyfrom_rev == parent_copyfrom_rev)):
                 # When being called recursively, if this child entry has the same ancestor as the
                 # the parent, then no need to try to run another "svn copy".
-                ui.status(prefix + ">> do_svn_add: svn_copy: Same ancestry as parent: %s",
-                    parent_copyfrom_path+"@"+str(parent_copyfrom_rev),level=ui.DEBUG, color='GREEN')
+                if debug:
+                    ui.status(">> do_svn_add: svn_copy: Same ancestry as parent: %s",
+                        parent_copyfrom_path+"@"+str(parent_copyfrom_rev),level=ui.DEBUG, indent=depth, color='GREEN')
                 pass
             else:
                 # Copy this path from the equivalent path+rev in the target repo, to create the
@@ -528,23 +835,24 @@ def do_svn_add(source_url, path_offset, source_rev, source_ancestors, \
                     # If we have a parent copy-from path, we mis-match that so display a status
                     # message describing the action we're mimic'ing. If path_in_svn, then this
                     # is logically a "replace" rather than an "add".
-                    ui.status(" %s %s (from %s)", ('R' if path_in_svn else 'A'), join_path(source_base, path_offset), ancestors[0]['copyfrom_path']+"@"+str(copyfrom_rev), level=ui.VERBOSE)
+                    ui.status(" %s %s (from %s)", ('R' if path_in_svn else 'A'), source_path, ancestors[0]['copyfrom_path']+"@"+str(copyfrom_rev), level=ui.VERBOSE)
                 if path_in_svn:
                     # If local file is already under version-control, then this is a replace.
-                    ui.status(prefix + ">> do_svn_add: pre-copy: local path already exists: %s", path_offset, level=ui.DEBUG, color='GREEN')
+                    ui.status(">> do_svn_add: pre-copy: local path already exists: %s", path_offset, level=ui.DEBUG, indent=depth, color='GREEN')
                     svnclient.update(path_offset)
                     svnclient.remove(path_offset, force=True)
+                    created_dirs.clear()
                 run_svn(["copy", "-r", tgt_rev, svnclient.safe_path(join_path(target_url, copyfrom_offset), tgt_rev), svnclient.safe_path(path_offset)])
                 if is_dir:
                     # Export the final verison of all files in this folder.
                     add_path(export_paths, path_offset)
                 else:
                     # Export the final verison of this file.
-                    svnclient.export(source_repos_url+join_path(source_base, path_offset), source_rev, path_offset, force=True)
+                    svnclient.export(source_repos_url+source_path, source_rev, path_offset, force=True)
                 if options.keep_prop:
                     sync_svn_props(source_url, source_rev, path_offset)
         else:
-            ui.status(prefix + ">> do_svn_add: Skipped 'svn copy': %s", path_offset, level=ui.DEBUG, color='GREEN')
+            ui.status(">> do_svn_add: Skipped 'svn copy': %s", path_offset, level=ui.DEBUG, indent=depth, color='GREEN')
     else:
         # Else, either this copy-from path has no ancestry back to source_url OR copyfrom_rev comes
         # before our initial source_start_rev (i.e. tgt_rev == None), so can't do a "svn copy".
@@ -552,57 +860,183 @@ def do_svn_add(source_url, path_offset, source_rev, source_ancestors, \
         # TODO: This is (nearly) a duplicate of code in process_svn_log_entry(). Should this be
         #       split-out to a shared tag?
         p_path = path_offset if is_dir else os.path.dirname(path_offset).strip() or None
-        if p_path and not os.path.exists(p_path):
-            run_svn(["mkdir", svnclient.safe_path(p_path)])
-        if not in_svn(path_offset, prefix=prefix+"  "):
+        made_dir = svn_mkdir(p_path) if p_path else False
+        # No need to ask "svn status" about a folder we just "svn mkdir"'d
+        if not (is_dir and made_dir) and not in_svn(path_offset, depth=depth+1):
             if is_dir:
                 # Export the final verison of all files in this folder.
                 add_path(export_paths, path_offset)
+                # If not already under version-control, then "svn add" this folder.
+                run_svn(["add", "--parents", svnclient.safe_path(path_offset)])
             else:
-                # Export the final verison of this file. We *need* to do this before running
-                # the "svn add", even if we end-up re-exporting this file again via export_paths.
-                svnclient.export(source_repos_url+join_path(source_base, path_offset), source_rev, path_offset, force=True)
-            # If not already under version-control, then "svn add" this file/folder.
-            run_svn(["add", "--parents", svnclient.safe_path(path_offset)])
-        if options.keep_prop:
+                # Defer the "svn export" and "svn add" of this file to the end of
+                # process_svn_log_entry(), where they're done in one batch.
+                add_path(added_files, path_offset)
+        if options.keep_prop and not path_in_list(added_files, path_offset):
             sync_svn_props(source_url, source_rev, path_offset)
     if is_dir:
         # For any folders that we process, process any child contents, so that we correctly
         # replay copies/replaces/etc.
         do_svn_add_dir(source_url, path_offset, source_rev, source_ancestors,
-                       copyfrom_path, copyfrom_rev, export_paths, skip_paths, prefix+"  ")
+                       copyfrom_path, copyfrom_rev, export_paths, skip_paths, depth+1)
 
 def do_svn_add_dir(source_url, path_offset, source_rev, source_ancestors, \
                    parent_copyfrom_path, parent_copyfrom_rev, \
-                   export_paths, skip_paths, prefix=""):
+                   export_paths, skip_paths, depth=0):
     source_base = source_url[len(source_repos_url):]  # e.g. '/trunk'
     # Get the directory contents, to compare between the local WC (target_url) vs. the remote repo (source_url)
     # TODO: paths_local won't include add'd paths because "svn ls" lists the contents of the
     #       associated remote repo folder. (Is this a problem?)
     paths_local =  svnclient.list(path_offset)
-    paths_remote = svnclient.list(join_path(source_url, path_offset), source_rev)
-    ui.status(prefix + ">> do_svn_add_dir: paths_local:  %s", str(paths_local),  level=ui.DEBUG, color='GREEN')
-    ui.status(prefix + ">> do_svn_add_dir: paths_remote: %s", str(paths_remote), level=ui.DEBUG, color='GREEN')
+    paths_remote = get_svn_dirlist(join_path(source_url, path_offset), source_rev)
+    if ui.get_level() >= ui.DEBUG:
+        # Only stringify these (potentially huge) lists if we'll actually display them
+        ui.status(">> do_svn_add_dir: paths_local:  %s", str(paths_local),  level=ui.DEBUG, indent=depth, color='GREEN')
+        ui.status(">> do_svn_add_dir: paths_remote: %s", str(paths_remote), level=ui.DEBUG, indent=depth, color='GREEN')
+    # Tracing each child's ancestry costs at least one "svn log" round-trip. Those
+    # lookups don't depend on each other (unlike the WC-modifying do_svn_add() calls
+    # below), so get them started concurrently.
+    working_paths = [join_path(path_offset, p['path']).lstrip('/') for p in paths_remote]
+    prefetch_ancestor_logs(source_repos_url,
+        [join_path(source_base, w) for w in working_paths if w not in skip_paths],
+        source_rev, max_threads=ancestor_prefetch_jobs)
     # Update files/folders which exist in remote but not local
     for p in paths_remote:
-        path_is_dir = True if p['kind'] == 'dir' else False
+        path_is_dir = p['kind'] == 'dir'
         working_path = join_path(path_offset, p['path']).lstrip('/')
         #print "working_path:%s = path_offset:%s + path:%s" % (working_path, path_offset, path)
         if not working_path in skip_paths:
             do_svn_add(source_url, working_path, source_rev, source_ancestors,
                        parent_copyfrom_path, parent_copyfrom_rev,
-                       export_paths, path_is_dir, skip_paths, prefix+"  ")
+                       export_paths, path_is_dir, skip_paths, depth+1)
     # Remove files/folders which exist in local but not remote
+    local_only = []
+    remote_entries = set([(p['path'], p['kind']) for p in paths_remote])
     for p in paths_local:
-        if not p in paths_remote:
+        if not (p['path'], p['kind']) in remote_entries:
             working_path = join_path(path_offset, p['path']).lstrip('/')
             ui.status(" %s %s", 'D', join_path(source_base, working_path), level=ui.VERBOSE)
-            svnclient.update(working_path)
-            svnclient.remove(working_path, force=True)
+            local_only.append(working_path)
+    if local_only:
+        # Batch these into a single "svn update" + "svn remove" rather than
+        # paying for two svn processes per path.
+        svnclient.update(local_only)
+        svnclient.remove(local_only, force=True)
+        created_dirs.clear()
             # TODO: Does this handle deleted folders too? Wouldn't want to have a case
             #       where we only delete all files from folder but leave orphaned folder around.
 
-def process_svn_log_entry(log_entry, ancestors, commit_paths, prefix = ""):
+def replay_add(log_entry, d, path_offset, ancestors, export_paths, depth=0):
+    """
+    Replay an "add" action (or the re-add half of a "replace") for a changed path.
+    """
+    source_rev = log_entry['revision']
+    source_url = log_entry['url']
+    source_base = source_url[len(source_repos_url):]  # e.g. '/trunk'
+    path_is_dir = d.kind == 'dir'
+    # Handle cases where this "add" was a copy from another URL in the source repo
+    if d.copyfrom_revision:
+        skip_paths = []
+        for tmp_d in log_entry['changed_paths']:
+            tmp_path = tmp_d.path
+            if is_child_path(tmp_path, d.path) and tmp_d.action in 'ARD':
+                # Build list of child entries which are also in the changed_paths list,
+                # so that do_svn_add() can skip processing these entries when recursing
+                # since we'll end-up processing them later. Don't include action="M" paths
+                # in this list because it's non-conclusive: it could just mean that the
+                # file was modified *after* the copy-from, so we still want do_svn_add()
+                # to re-create the correct ancestry.
+                tmp_path_offset = tmp_path[len(source_base):].strip("/")
+                skip_paths.append(tmp_path_offset)
+        do_svn_add(source_url, path_offset, source_rev, ancestors, "", "", export_paths, path_is_dir, skip_paths, depth+1,
+                   known_copyfrom=(d.copyfrom_path, d.copyfrom_revision))
+    # Else just "svn export" the files from the source repo and "svn add" them.
+    else:
+        # Create (parent) directory if needed
+        p_path = path_offset if path_is_dir else os.path.dirname(path_offset).strip() or None
+        made_dir = svn_mkdir(p_path) if p_path else False
+        # Export the entire added tree.
+        if path_is_dir:
+            # For directories, defer the (recurisve) "svn export". Might have a
+            # situation in a branch merge where the entry in the svn-log is a
+            # non-copy-from'd "add" but there are child contents (that we haven't
+            # gotten to yet in log_entry) that are copy-from's.  When we try do
+            # the "svn copy" later on in do_svn_add() for those copy-from'd paths,
+            # having pre-existing (svn-add'd) contents creates some trouble.
+            # Instead, just create the stub folders ("svn mkdir" above) and defer
+            # exporting the final file-state until the end.
+            add_path(export_paths, path_offset)
+            if not made_dir and not in_svn(path_offset, depth=depth+1):
+                # Need to use in_svn here to handle cases where client committed the parent
+                # folder and each indiv sub-folder.
+                run_svn(["add", "--parents", svnclient.safe_path(path_offset)])
+            if options.keep_prop:
+                sync_svn_props(source_url, source_rev, path_offset)
+        else:
+            # Defer the "svn export" and "svn add" of this file to the end of
+            # process_svn_log_entry(), where they're done in one batch.
+            add_path(added_files, path_offset)
+
+def replay_replace(log_entry, d, path_offset, ancestors, export_paths, depth=0):
+    """
+    Replay a "replace" action for a changed path.
+    """
+    # If file was "replaced" (deleted then re-added, all in same revision),
+    # then we need to run the "svn rm" first, then handle it as an "add".
+    # This should replicate the "replace".
+    if path_offset and in_svn(path_offset):
+        # Target path might not be under version-control yet, e.g. parent "add"
+        # was a copy-from a branch which had no ancestry back to trunk, and each
+        # child folder under that parent folder is a "replace" action on the final
+        # merge to trunk. Since the child folders will be in skip_paths, do_svn_add
+        # wouldn't have created them while processing the parent "add" path.
+        if d.kind == 'dir':
+            # Need to "svn update" before "svn remove" in case child contents are at
+            # a higher rev than the (parent) path_offset.
+            svnclient.update(path_offset)
+        svnclient.remove(path_offset, force=True)
+        created_dirs.clear()
+    replay_add(log_entry, d, path_offset, ancestors, export_paths, depth)
+
+def replay_delete(log_entry, d, path_offset, ancestors, export_paths, depth=0):
+    """
+    Replay a "delete" action for a changed path.
+    """
+    # Defer the actual "svn remove" until the end of this revision, so that all
+    # deletes for a revision go out as a single svn command.
+    add_path(removed_paths, path_offset)
+
+def replay_modify(log_entry, d, path_offset, ancestors, export_paths, depth=0):
+    """
+    Replay a "modify" action for a changed path.
+    """
+    source_rev = log_entry['revision']
+    source_url = log_entry['url']
+    if d.kind == 'file':
+        # Defer the "svn export", so it can run in parallel with the others at the
+        # end of process_svn_log_entry().
+        add_path(export_paths, path_offset)
+    if d.kind == 'dir':
+        # For dirs, need to "svn update" before export/prop-sync because the
+        # final "svn commit" will fail if the parent is at a lower rev than
+        # child contents. Just need to update the rev-state of the dir (d.path),
+        # don't need to recursively update all child contents.
+        # (??? is this the right reason?)
+        # Defer this (and the prop-sync) until the end of process_svn_log_entry(),
+        # so that all modified dirs get updated with a single "svn update".
+        modified_dirs.append(path_offset)
+    elif options.keep_prop:
+        sync_svn_props(source_url, source_rev, path_offset)
+
+# Dispatch table of "svn log" action -> replay handler
+replay_actions = {
+    'A': replay_add,
+    'R': replay_replace,
+    'D': replay_delete,
+    'M': replay_modify,
+}
+
+def process_svn_log_entry(log_entry, ancestors, commit_paths, depth=0):
     """
     Process SVN changes from the given log entry. Build an array (commit_paths)
     of the paths in the working-copy that were changed, i.e. the paths which
@@ -612,139 +1046,85 @@ def process_svn_log_entry(log_entry, ancestors, commit_paths, prefix = ""):
     source_rev = log_entry['revision']
     source_url = log_entry['url']
     source_base = source_url[len(source_repos_url):]  # e.g. '/trunk'
-    ui.status(prefix + ">> process_svn_log_entry: %s", source_url+"@"+str(source_rev), level=ui.DEBUG, color='GREEN')
-    for d in log_entry['changed_paths']:
+    source_base_prefix = source_base+"/"
+    source_base_len = len(source_base_prefix)
+    # Only keep cached "svn list"/"svn log" results around for the duration of a single revision
+    dirlist_cache.clear()
+    clear_ancestor_cache()
+    del removed_paths[:]
+    del added_files[:]
+    del modified_dirs[:]
+    created_dirs.clear()
+    debug = ui.get_level() >= ui.DEBUG
+    if debug:
+        ui.status(">> process_svn_log_entry: %s", source_url+"@"+str(source_rev), level=ui.DEBUG, indent=depth, color='GREEN')
+    # Ignore changed files that are not part of this subdir
+    changed_paths = [d for d in log_entry['changed_paths']
+                     if d.path.startswith(source_base_prefix) or d.path == source_base]
+    if debug and len(changed_paths) < len(log_entry['changed_paths']):
+        for d in log_entry['changed_paths']:
+            if not is_child_path(d.path, source_base):
+                ui.status(">> process_svn_log_entry: Unrelated path: %s  (base: %s)", d.path, source_base, level=ui.DEBUG, indent=depth, color='GREEN')
+    for d in changed_paths:
         # Get the full path for this changed_path
         # e.g. '/branches/bug123/projectA/file1.txt'
-        path = d['path']
-        if not is_child_path(path, source_base):
-            # Ignore changed files that are not part of this subdir
-            ui.status(prefix + ">> process_svn_log_entry: Unrelated path: %s  (base: %s)", path, source_base, level=ui.DEBUG, color='GREEN')
-            continue
-        if d['kind'] == "" or d['kind'] == 'none':
+        path = d.path
+        if d.kind == "" or d.kind == 'none':
             # The "kind" value was introduced in SVN 1.6, and "svn log --xml" won't return a "kind"
             # value for commits made on a pre-1.6 repo, even if the server is now running 1.6.
             # We need to use other methods to fetch the node-kind for these cases.
-            d['kind'] = svnclient.get_kind(source_repos_url, path, source_rev, d['action'], log_entry['changed_paths'])
-        assert (d['kind'] == 'file') or (d['kind'] == 'dir')
-        path_is_dir =  True if d['kind'] == 'dir'  else False
-        path_is_file = True if d['kind'] == 'file' else False
+            d.kind = svnclient.get_kind(source_repos_url, path, source_rev, d.action, log_entry['changed_paths'])
+        assert (d.kind == 'file') or (d.kind == 'dir')
         # Calculate the offset (based on source_base) for this changed_path
         # e.g. 'projectA/file1.txt'
         # (path = source_base + "/" + path_offset)
-        path_offset = path[len(source_base):].strip("/")
+        path_offset = path[source_base_len:]
         # Get the action for this path
-        action = d['action']
+        action = d.action
         if action not in svnclient.valid_svn_actions:
             raise UnsupportedSVNAction("In SVN rev. %d: action '%s' not supported. Please report a bug!"
                 % (source_rev, action))
-        ui.status(" %s %s%s", action, d['path'],
-            (" (from %s)" % (d['copyfrom_path']+"@"+str(d['copyfrom_revision']))) if d['copyfrom_path'] else "",
+        ui.status(" %s %s%s", action, d.path,
+            (" (from %s)" % (d.copyfrom_path+"@"+str(d.copyfrom_revision))) if d.copyfrom_path else "",
             level=ui.VERBOSE)
 
         # Try to be efficient and keep track of an explicit list of paths in the
         # working copy that changed. If we commit from the root of the working copy,
         # then SVN needs to crawl the entire working copy looking for pending changes.
-        commit_paths.append(path_offset)
-
-        # Special-handling for replace's
-        if action == 'R':
-            # If file was "replaced" (deleted then re-added, all in same revision),
-            # then we need to run the "svn rm" first, then change action='A'. This
-            # lets the normal code below handle re-"svn add"'ing the files. This
-            # should replicate the "replace".
-            if path_offset and in_svn(path_offset):
-                # Target path might not be under version-control yet, e.g. parent "add"
-                # was a copy-from a branch which had no ancestry back to trunk, and each
-                # child folder under that parent folder is a "replace" action on the final
-                # merge to trunk. Since the child folders will be in skip_paths, do_svn_add
-                # wouldn't have created them while processing the parent "add" path.
-                if path_is_dir:
-                    # Need to "svn update" before "svn remove" in case child contents are at
-                    # a higher rev than the (parent) path_offset.
-                    svnclient.update(path_offset)
-                svnclient.remove(path_offset, force=True)
-            action = 'A'
+        # (Paths under an already-listed folder are covered by the recursive commit.)
+        add_path(commit_paths, path_offset)
 
         # Handle all the various action-types
-        # (Handle "add" first, for "svn copy/move" support)
-        if action == 'A':
-            # Determine where to export from.
-            svn_copy = False
-            # Handle cases where this "add" was a copy from another URL in the source repo
-            if d['copyfrom_revision']:
-                copyfrom_path = d['copyfrom_path']
-                copyfrom_rev =  d['copyfrom_revision']
-                skip_paths = []
-                for tmp_d in log_entry['changed_paths']:
-                    tmp_path = tmp_d['path']
-                    if is_child_path(tmp_path, path) and tmp_d['action'] in 'ARD':
-                        # Build list of child entries which are also in the changed_paths list,
-                        # so that do_svn_add() can skip processing these entries when recursing
-                        # since we'll end-up processing them later. Don't include action="M" paths
-                        # in this list because it's non-conclusive: it could just mean that the
-                        # file was modified *after* the copy-from, so we still want do_svn_add()
-                        # to re-create the correct ancestry.
-                        tmp_path_offset = tmp_path[len(source_base):].strip("/")
-                        skip_paths.append(tmp_path_offset)
-                do_svn_add(source_url, path_offset, source_rev, ancestors, "", "", export_paths, path_is_dir, skip_paths, prefix+"  ")
-            # Else just "svn export" the files from the source repo and "svn add" them.
-            else:
-                # Create (parent) directory if needed
-                p_path = path_offset if path_is_dir else os.path.dirname(path_offset).strip() or None
-                if p_path and not os.path.exists(p_path):
-                    run_svn(["mkdir", svnclient.safe_path(p_path)])
-                # Export the entire added tree.
-                if path_is_dir:
-                    # For directories, defer the (recurisve) "svn export". Might have a
-                    # situation in a branch merge where the entry in the svn-log is a
-                    # non-copy-from'd "add" but there are child contents (that we haven't
-                    # gotten to yet in log_entry) that are copy-from's.  When we try do
-                    # the "svn copy" later on in do_svn_add() for those copy-from'd paths,
-                    # having pre-existing (svn-add'd) contents creates some trouble.
-                    # Instead, just create the stub folders ("svn mkdir" above) and defer
-                    # exporting the final file-state until the end.
-                    add_path(export_paths, path_offset)
-                else:
-                    # Export the final verison of this file. We *need* to do this before running
-                    # the "svn add", even if we end-up re-exporting this file again via export_paths.
-                    svnclient.export(join_path(source_url, path_offset), source_rev, path_offset, force=True)
-                if not in_svn(path_offset, prefix=prefix+"  "):
-                    # Need to use in_svn here to handle cases where client committed the parent
-                    # folder and each indiv sub-folder.
-                    run_svn(["add", "--parents", svnclient.safe_path(path_offset)])
-                if options.keep_prop:
-                    sync_svn_props(source_url, source_rev, path_offset)
+        replay_actions[action](log_entry, d, path_offset, ancestors, export_paths, depth)
 
-        elif action == 'D':
-            if path_is_dir:
-                # For dirs, need to "svn update" before "svn remove" because the final
-                # "svn commit" will fail if the parent (path_offset) is at a lower rev
-                # than any of the child contents. This needs to be a recursive update.
-                svnclient.update(path_offset)
-            svnclient.remove(path_offset, force=True)
-
-        elif action == 'M':
-            if path_is_file:
-                svnclient.export(join_path(source_url, path_offset), source_rev, path_offset, force=True, non_recursive=True)
-            if path_is_dir:
-                # For dirs, need to "svn update" before export/prop-sync because the
-                # final "svn commit" will fail if the parent is at a lower rev than
-                # child contents. Just need to update the rev-state of the dir (d['path']),
-                # don't need to recursively update all child contents.
-                # (??? is this the right reason?)
-                svnclient.update(path_offset, non_recursive=True)
-            if options.keep_prop:
+    # Update (and sync props for) all modified dirs in one pass
+    if modified_dirs:
+        svnclient.update(modified_dirs, non_recursive=True)
+        if options.keep_prop:
+            for path_offset in modified_dirs:
+                sync_svn_props(source_url, source_rev, path_offset)
+    # Remove all deleted paths in one pass
+    if removed_paths:
+        # For dirs, need to "svn update" before "svn remove" because the final
+        # "svn commit" will fail if the parent is at a lower rev than any of
+        # the child contents. This needs to be a recursive update. Updating a
+        # file is harmless, so just update everything we're about to remove.
+        svnclient.update(removed_paths)
+        svnclient.remove(removed_paths, force=True)
+    # Export the final version of all add'd paths (and non-copied added files, unless
+    # inside one of those add'd folders) from source_url. These don't overlap and
+    # only read from the source repo, so they can run concurrently.
+    exports = export_paths + [p for p in added_files if not path_in_list(export_paths, p)]
+    exports = coalesce_export_paths(source_url, source_rev, exports)
+    if exports:
+        run_parallel([(svnclient.export, (join_path(source_url, p), source_rev, p, False, True))
+                      for p in exports], max_threads=options.export_jobs)
+    # "svn add" all the (non-copied) added files in one pass
+    if added_files:
+        run_svn(["add", "--parents", "--force"], [svnclient.safe_path(p) for p in added_files])
+        if options.keep_prop:
+            for path_offset in added_files:
                 sync_svn_props(source_url, source_rev, path_offset)
-
-        else:
-            raise InternalError("Internal Error: process_svn_log_entry: Unhandled 'action' value: '%s'"
-                % action)
-
-    # Export the final version of all add'd paths from source_url
-    if export_paths:
-        for path_offset in export_paths:
-            svnclient.export(join_path(source_url, path_offset), source_rev, path_offset, force=True)
 
 def keep_revnum(source_rev, target_rev_last, wc_target_tmp):
     """
@@ -762,11 +1142,12 @@ def keep_revnum(source_rev, target_rev_last, wc_target_tmp):
             shell.rmtree(wc_target_tmp)
         run_svn(["checkout", "-r", "HEAD", "--depth=empty", svnclient.safe_path(target_repos_url, "HEAD"), svnclient.safe_path(wc_target_tmp)])
         for rev_num in range(int(target_rev_last)+1, int(source_rev)):
-            run_svn(["propset", "svn2svn:keep-revnum", rev_num, svnclient.safe_path(wc_target_tmp)])
+            # Run these from inside wc_target_tmp, rather than changing our own cwd
+            run_svn(["propset", "svn2svn:keep-revnum", rev_num, "."], cwd=wc_target_tmp)
             # Prevent Ctrl-C's during this inner part, so we'll always display
             # the "Commit revision ..." message if we ran a "svn commit".
             bh.enable()
-            output = run_svn(["commit", "-m", "", svnclient.safe_path(wc_target_tmp)])
+            output = run_svn(["commit", "-m", "", "."], cwd=wc_target_tmp)
             rev_num_tmp = parse_svn_commit_rev(output) if output else None
             assert rev_num == rev_num_tmp
             ui.status("Committed revision %s (keep-revnum).", rev_num)
@@ -779,11 +1160,13 @@ def keep_revnum(source_rev, target_rev_last, wc_target_tmp):
     return target_rev_last
 
 def disp_svn_log_summary(log_entry):
+    if ui.get_level() < ui.VERBOSE:
+        return
     ui.status("------------------------------------------------------------------------", level=ui.VERBOSE)
     ui.status("r%s | %s | %s",
         log_entry['revision'],
         log_entry['author'],
-        str(datetime.fromtimestamp(int(log_entry['date'])).isoformat(' ')), level=ui.VERBOSE)
+        log_entry['date_str'], level=ui.VERBOSE)
     ui.status(log_entry['message'], level=ui.VERBOSE)
 
 def real_main(args):
@@ -796,10 +1179,11 @@ def real_main(args):
     target_url = urllib.unquote(args.pop(0).rstrip("/"))   # e.g. 'file:///svn/target/trunk'
     ui.status("options: %s", str(options), level=ui.DEBUG, color='GREEN')
 
-    # Make sure that both the source and target URL's are valid
-    source_info = svnclient.info(source_url)
+    # Make sure that both the source and target URL's are valid. These are
+    # independent (and often on different servers), so check both at once.
+    source_info, target_info = run_parallel([(svnclient.info, (source_url,)),
+                                             (svnclient.info, (target_url,))])
     assert is_child_path(source_url, source_info['repos_url'])
-    target_info = svnclient.info(target_url)
     assert is_child_path(target_url, target_info['repos_url'])
 
     # Init global vars
@@ -811,15 +1195,24 @@ def real_main(args):
     target_repos_url = target_info['repos_url']       # e.g. 'http://server/svn/target'
     target_base = target_url[len(target_repos_url):]  # e.g. '/trunk'
 
-    # Init start and end revision
-    try:
-        source_start_rev = svnclient.get_rev(source_repos_url, options.rev_start if options.rev_start else 1)
-    except ExternalCommandFailed:
+    # Init start and end revision. The defaults (1:HEAD) need no lookup, since
+    # "svn info" on source_url already gave us the HEAD revision. Resolve any
+    # user-supplied revision args concurrently.
+    def _get_rev(rev_number):
+        try:
+            return svnclient.get_rev(source_repos_url, rev_number)
+        except ExternalCommandFailed:
+            return None
+    source_start_rev = 1
+    source_end_rev = source_info['revision']
+    if options.rev_start or options.rev_end:
+        source_start_rev, source_end_rev = run_parallel([
+            (_get_rev, (options.rev_start if options.rev_start else 1,)),
+            (_get_rev, (options.rev_end   if options.rev_end   else "HEAD",))])
+    if source_start_rev is None:
         print "Error: Invalid start source revision value: %s" % (options.rev_start)
         return 1
-    try:
-        source_end_rev   = svnclient.get_rev(source_repos_url, options.rev_end   if options.rev_end   else "HEAD")
-    except ExternalCommandFailed:
+    if source_end_rev is None:
         print "Error: Invalid end source revision value: %s" % (options.rev_end)
         return 1
     ui.status("Using source revision range %s:%s", source_start_rev, source_end_rev, level=ui.VERBOSE)
@@ -829,7 +1222,9 @@ def real_main(args):
     #       before doing first replay-commit?
 
     target_rev_last =  target_info['revision']   # Last revision # in the target repo
-    wc_target = options.wc_path if options.wc_path else os.path.abspath('_wc_target')
+    # Use absolute paths, since we chdir into wc_target below (and wc_target_tmp
+    # is used from there too).
+    wc_target = os.path.abspath(options.wc_path if options.wc_path else '_wc_target')
     wc_target_tmp = wc_target + '_tmp'
     num_entries_proc = 0
     commit_count = 0
@@ -838,9 +1233,20 @@ def real_main(args):
 
     # Check out a working copy of target_url if needed
     wc_exists = os.path.exists(wc_target)
+    wc_update = False
     if wc_exists and not options.cont_from_break:
-        shell.rmtree(wc_target)
-        wc_exists = False
+        # If the existing WC is already a checkout of target_url, just clean it up
+        # and bring it up-to-date, rather than throwing it away and re-checking-out
+        # the whole thing.
+        try:
+            wc_info = svnclient.info(wc_target)
+        except ExternalCommandFailed:
+            wc_info = None
+        if wc_info and wc_info['url'] == target_info['url'] and wc_info['repos_uuid'] == target_info['repos_uuid']:
+            wc_update = True
+        else:
+            shell.rmtree(wc_target)
+            wc_exists = False
     if not wc_exists:
         ui.status("Checking-out wc_target: %s ...", wc_target, level=ui.VERBOSE)
         svnclient.svn_checkout(target_url, wc_target)
@@ -848,26 +1254,42 @@ def real_main(args):
     if wc_exists:
         # If using an existing WC, make sure it's clean ("svn revert")
         ui.status("Cleaning-up wc_target: %s ...", wc_target, level=ui.VERBOSE)
-        run_svn(["cleanup"])
-        full_svn_revert()
+        cleanup_wc()
+        if wc_update:
+            svnclient.update(".")
+
+    # Keep an on-disk copy of rev_map in the WC's admin dir, so continue-mode
+    # doesn't need to re-scan the whole target_url history to rebuild it.
+    rev_map_path = os.path.join(wc_target, '.svn', 'svn2svn-revmap')
 
+    source_ancestors = None
     if not options.cont_from_break:
         # Warn user if trying to start (non-continue) into a non-empty target path
+        target_top_paths = svnclient.list(target_url, "HEAD")
         if not options.force_nocont:
-            top_paths = svnclient.list(target_url, "HEAD")
-            if len(top_paths)>0:
+            if len(target_top_paths)>0:
                 print "Error: Trying to replay (non-continue-mode) into a non-empty target_url location. " \
                       "Use --force if you're sure this is what you want."
                 return 1
+        # Only start a fresh rev_map file once we know we're going ahead, so that
+        # bailing out above doesn't throw away the one saved by a previous run.
+        open_rev_map_file(rev_map_path, source_info)
         # Get the first log entry at/after source_start_rev, which is where
         # we'll do the initial import from.
-        source_ancestors = find_svn_ancestors(source_repos_url, source_base, source_end_rev, prefix="  ")
-        it_log_start = svnclient.iter_svn_log_entries(source_url, source_start_rev, source_end_rev, get_changed_paths=False, ancestors=source_ancestors)
+        source_ancestors = find_svn_ancestors(source_repos_url, source_base, source_end_rev, depth=1)
         source_start_log = None
-        for log_entry in it_log_start:
-            # Pick the first entry. Need to use a "for ..." loop since we're using an iterator.
-            source_start_log = log_entry
-            break
+        if not source_ancestors:
+            # No ancestry to follow, so a single "svn log --limit 1" gets us the first entry.
+            try:
+                source_start_log = svnclient.get_one_svn_log_entry(source_url, source_start_rev, source_end_rev, get_changed_paths=False)
+            except EmptySVNLog:
+                pass
+        else:
+            it_log_start = svnclient.iter_svn_log_entries(source_url, source_start_rev, source_end_rev, get_changed_paths=False, ancestors=source_ancestors)
+            for log_entry in it_log_start:
+                # Pick the first entry. Need to use a "for ..." loop since we're using an iterator.
+                source_start_log = log_entry
+                break
         if not source_start_log:
             raise InternalError("Unable to find any matching revisions between %s:%s in source_url: %s" % \
                 (source_start_rev, source_end_rev, source_url))
@@ -881,29 +1303,32 @@ def real_main(args):
 
         # For the initial commit to the target URL, export all the contents from
         # the source URL at the start-revision.
-        disp_svn_log_summary(svnclient.get_one_svn_log_entry(source_repos_url, source_start_rev, source_start_rev))
+        disp_svn_log_summary(source_start_log)
         # Export and add file-contents from source_url@source_start_rev
-        source_start_url = source_url if not source_ancestors else source_repos_url+source_ancestors[len(source_ancestors)-1]['copyfrom_path']
-        top_paths = svnclient.list(source_start_url, source_start_rev)
+        source_start_url = source_url if not source_ancestors else source_repos_url+source_ancestors[-1]['copyfrom_path']
+        # A single recursive "svn list" gives us both the top-level entries and (below)
+        # every path we're about to add.
+        paths = svnclient.list(source_start_url, source_start_rev, recursive=True)
+        top_paths = [p for p in paths if '/' not in p['path']]
+        target_top_names = set([p['path'] for p in target_top_paths])
         for p in top_paths:
             # For each top-level file/folder...
-            path_is_dir = True if p['kind'] == "dir" else False
-            path_offset = p['path']
-            if in_svn(path_offset, prefix="  "):
-                raise InternalError("Cannot replay history on top of pre-existing structure: %s" % join_path(source_start_url, path_offset))
-            if path_is_dir and not os.path.exists(path_offset):
-                os.makedirs(path_offset)
-            svnclient.export(join_path(source_start_url, path_offset), source_start_rev, path_offset, force=True)
-            run_svn(["add", svnclient.safe_path(path_offset)])
+            if p['path'] in target_top_names:
+                raise InternalError("Cannot replay history on top of pre-existing structure: %s" % join_path(source_start_url, p['path']))
+        if top_paths:
+            # Export the whole tree in one go, then "svn add" all the top-level
+            # files/folders with a single command.
+            svnclient.export(source_start_url, source_start_rev, ".", force=True)
+            run_svn(["add"], [svnclient.safe_path(p['path']) for p in top_paths])
         # Update any properties on the newly added content
-        paths = svnclient.list(source_start_url, source_start_rev, recursive=True)
         if options.keep_prop:
             sync_svn_props(source_start_url, source_start_rev, "")
-        for p in paths:
-            path_offset = p['path']
-            ui.status(" A %s", join_path(source_base, path_offset), level=ui.VERBOSE)
-            if options.keep_prop:
-                sync_svn_props(source_start_url, source_start_rev, path_offset)
+        if options.keep_prop or ui.get_level() >= ui.VERBOSE:
+            for p in paths:
+                path_offset = p['path']
+                ui.status(" A %s", join_path(source_base, path_offset), level=ui.VERBOSE)
+                if options.keep_prop:
+                    sync_svn_props(source_start_url, source_start_rev, path_offset)
         # Commit the initial import
         num_entries_proc += 1
         target_revprops = gen_tracking_revprops(source_start_rev)   # Build source-tracking revprop's
@@ -916,23 +1341,48 @@ def real_main(args):
             if options.verify:
                 verify_commit(source_start_rev, target_rev_last)
     else:
-        # Re-build the rev_map based on any already-replayed history in target_url
-        build_rev_map(target_url, target_rev_last, source_info)
+        # Re-build the rev_map based on any already-replayed history in target_url.
+        # Start from the rev_map file saved by the previous run (if any), and only
+        # scan the target revisions committed after that.
+        rev_map_last = open_rev_map_file(rev_map_path, source_info, load=True)
+        if rev_map:
+            ui.status("Loaded %s rev_map entries from: %s", len(rev_map), rev_map_path, level=ui.VERBOSE)
+        build_rev_map(target_url, target_rev_last, source_info, rev_map_last+1)
         if not rev_map:
+            close_rev_map_file()
             print "Error: Called with continue-mode, but no already-replayed source history found in target_url."
             return 1
-        source_start_rev = int(max(rev_map, key=rev_map.get))
+        # Resume after the newest replayed source rev. (With --batch-size, several source
+        # revs map to the same target rev, so don't pick by target rev.)
+        source_start_rev = rev_map_keys[-1]
         assert source_start_rev
         ui.status("Continuing from source revision %s.", source_start_rev, level=ui.VERBOSE)
         ui.status("", level=ui.VERBOSE)
 
+    # Periodic "svn cleanup" is only useful on SVN 1.7+ (WC-NG pristine store). On 1.10+,
+    # only vacuum the unreferenced pristines rather than doing a full cleanup pass.
+    # (Compare version tuples: as a float, "1.10" would sort before "1.7".)
     svn_vers_t = svnclient.version()
-    svn_vers = float(".".join(map(str, svn_vers_t[0:2])))
+    if svn_vers_t[0:2] >= (1, 10):
+        periodic_cleanup_args = ["cleanup", "--vacuum-pristines"]
+    elif svn_vers_t[0:2] >= (1, 7):
+        periodic_cleanup_args = ["cleanup"]
+    else:
+        periodic_cleanup_args = None
 
     # Load SVN log starting from source_start_rev + 1
-    source_ancestors = find_svn_ancestors(source_repos_url, source_base, source_end_rev, prefix="  ")
-    it_log_entries = svnclient.iter_svn_log_entries(source_url, source_start_rev+1, source_end_rev, get_revprops=True, ancestors=source_ancestors) if source_start_rev < source_end_rev else []
+    if source_ancestors is None:
+        # (Not already found for the initial import above)
+        source_ancestors = find_svn_ancestors(source_repos_url, source_base, source_end_rev, depth=1)
+    # For in_ancestors(): an ancestors chain is ordered newest-first, so its
+    # revision #'s are descending.
+    global source_ancestor_revs
+    source_ancestor_revs = [int(a['revision']) for a in reversed(source_ancestors[1:])]
+    # Fetch upcoming log entries in the background while replaying/committing the current one
+    it_log_entries = prefetch_iter(svnclient.iter_svn_log_entries(source_url, source_start_rev+1, source_end_rev, get_revprops=True, ancestors=source_ancestors)) if source_start_rev < source_end_rev else []
     source_rev_last = source_start_rev
+    batch_entries = []   # Source log entries replayed into _wc_target but not yet committed
+    commit_paths = []
     exit_code = 0
 
     try:
@@ -951,52 +1401,86 @@ def real_main(args):
                     return 1
                 target_rev_last = keep_revnum(source_rev, target_rev_last, wc_target_tmp)
             disp_svn_log_summary(log_entry)
+            if not options.keep_prop and is_prop_only_log_entry(log_entry):
+                # Property-only revision (e.g. a "record-only" merge, which only changes
+                # svn:mergeinfo) and we're not carrying properties forward, so there's
+                # nothing to replay or commit.
+                ui.status("(Skipping property-only source revision r%s)", source_rev, level=ui.VERBOSE)
+                num_entries_proc += 1
+                source_rev_last = source_rev
+                continue
             # Process all the changed-paths in this log entry
-            commit_paths = []
             process_svn_log_entry(log_entry, source_ancestors, commit_paths)
             num_entries_proc += 1
+            batch_entries.append(log_entry)
+            if len(batch_entries) < options.batch_size and is_prop_only_log_entry(log_entry):
+                # Fold this property-only revision into the next target commit
+                continue
             # Commit any changes made to _wc_target
-            target_revprops = gen_tracking_revprops(source_rev)   # Build source-tracking revprop's
-            target_rev = commit_from_svn_log_entry(log_entry, commit_paths, target_revprops=target_revprops)
+            target_rev = commit_log_entries(batch_entries, commit_paths)
             source_rev_last = source_rev
+            batch_entries = []
+            commit_paths = []
             if target_rev:
-                # Update rev_map, mapping table of source-repo rev # -> target-repo rev #
-                source_rev = log_entry['revision']
-                set_rev_map(source_rev, target_rev)
                 target_rev_last = target_rev
                 commit_count += 1
                 if options.verify:
                     verify_commit(source_rev, target_rev_last, log_entry)
                 # Run "svn cleanup" every 100 commits if SVN 1.7+, to clean-up orphaned ".svn/pristines/*"
-                if svn_vers >= 1.7 and (commit_count % 100 == 0):
-                    run_svn(["cleanup"])
+                if periodic_cleanup_args and (commit_count % 100 == 0):
+                    run_svn(periodic_cleanup_args)
+        if batch_entries:
+            # Commit any left-over batched property-only revisions
+            target_rev = commit_log_entries(batch_entries, commit_paths)
+            source_rev_last = batch_entries[-1]['revision']
+            if target_rev:
+                target_rev_last = target_rev
+                commit_count += 1
+                if options.verify:
+                    verify_commit(source_rev_last, target_rev_last, batch_entries[-1])
         if source_rev_last == source_start_rev:
             # If there were no new source_url revisions to process, still trigger
             # "full-mode" verify check (if enabled).
             if options.verify:
                 verify_commit(source_rev_last, target_rev_last)
 
-    except KeyboardInterrupt:
-        exit_code = 1
-        print "\nStopped by user."
-        print "\nCleaning-up..."
-        run_svn(["cleanup"])
-        full_svn_revert()
-    except:
+    except (KeyboardInterrupt, Exception), e:
         exit_code = 1
-        print "\nCommand failed with following error:\n"
-        traceback.print_exc()
-        print "\nCleaning-up..."
-        run_svn(["cleanup"])
-        print run_svn(["status"])
-        full_svn_revert()
+        if isinstance(e, KeyboardInterrupt):
+            print "\nStopped by user."
+        else:
+            print "\nCommand failed with following error:\n"
+            # (The traceback goes to stderr, so flush what's buffered on stdout first)
+            sys.stdout.flush()
+            traceback.print_exc()
+        print "\nCleaning-up... (press Ctrl-C again to skip)"
+        try:
+            cleanup_wc(show_status=not isinstance(e, KeyboardInterrupt))
+        except KeyboardInterrupt:
+            # Clean-up on a large WC can take a while. Leaving it half-done is
+            # safe: the next run re-uses this WC and cleans it up first.
+            print "\nSkipped clean-up; wc_target will be cleaned-up on the next run."
     finally:
+        close_rev_map_file()
         print "\nFinished at source revision %s%s." % (source_rev_last, " (dry-run)" if options.dry_run else "")
 
     return exit_code
 
-def main():
-    # Defined as entry point. Must be callable without arguments.
+# Reg-ex for matching a revision arg (http://svnbook.red-bean.com/en/1.5/svn.tour.revs.specifiers.html#svn.tour.revs.dates)
+rev_patt = '[0-9A-Z]+|\{[0-9A-Za-z/\\ :-]+\}'
+rev_range_re =  re.compile('^('+rev_patt+'):('+rev_patt+')$')
+rev_single_re = re.compile('^('+rev_patt+')$')
+
+_parser = None   # Cached result of build_parser()
+
+def build_parser():
+    """
+    Build the command-line option parser. The parser is built only once and
+    re-used by any later main() calls.
+    """
+    global _parser
+    if _parser is not None:
+        return _parser
     usage = "svn2svn, version %s\n" % str(full_version) + \
             "<http://nynim.org/code/svn2svn> <https://github.com/tonyduckles/svn2svn>\n\n" + \
             "Usage: %prog [OPTIONS] source_url target_url\n"
@@ -1062,6 +1546,13 @@ Examples:
                       help="Append source commit time to replayed commit messages.")
     parser.add_option("-l", "--limit", type="int", dest="entries_proc_limit", metavar="NUM",
                       help="Maximum number of source revisions to process.")
+    parser.add_option("--batch-size", type="int", dest="batch_size", metavar="NUM", default=1,
+                      help="Fold up to NUM consecutive property-only source revisions "
+                           "(e.g. record-only merges) into a single target commit. "
+                           "Not compatible with --keep-revnum.")
+    parser.add_option("--export-jobs", type="int", dest="export_jobs", metavar="NUM", default=4,
+                      help="Run up to NUM \"svn export\" commands in parallel when "
+                           "replaying a revision (default: 4).")
     parser.add_option("-n", "--dry-run", action="store_true", dest="dry_run", default=False,
                       help="Process next source revision but don't commit changes to "
                            "target working-copy (forces --limit=1).")
@@ -1069,6 +1560,9 @@ Examples:
                       help="Verify ancestry and content for changed paths in commit after every target commit or last target commit.")
     parser.add_option("-X", "--verify-all", action="store_const", const=2, dest="verify",
                       help="Verify ancestry and content for entire target_url tree after every target commit or last target commit.")
+    parser.add_option("--verify-jobs", type="int", dest="verify_jobs", metavar="NUM", default=4,
+                      help="Verify up to NUM paths in parallel with --verify/--verify-all "
+                           "(default: 4).")
     parser.add_option("--pre-commit", type="string", dest="beforecommit", metavar="CMD",
                       help="Run the given shell script before each replayed commit, e.g. "
                            "to modify file-content during replay.\n"
@@ -1077,6 +1571,12 @@ Examples:
                       help='Path to target WC to create and use. Defaults to "./_wc_target".')
     parser.add_option("--debug", dest="verbosity", const=ui.DEBUG, action="store_const",
                       help="Enable debugging output (same as -vvv).")
+    _parser = parser
+    return parser
+
+def main():
+    # Defined as entry point. Must be callable without arguments.
+    parser = build_parser()
     global options
     options, args = parser.parse_args()
     if len(args) != 2:
@@ -1090,16 +1590,22 @@ Examples:
     options.rev_start = None
     options.rev_end   = None
     if options.revision:
-        # Reg-ex for matching a revision arg (http://svnbook.red-bean.com/en/1.5/svn.tour.revs.specifiers.html#svn.tour.revs.dates)
-        rev_patt = '[0-9A-Z]+|\{[0-9A-Za-z/\\ :-]+\}'
         rev = None
-        match = re.match('^('+rev_patt+'):('+rev_patt+')$', options.revision)  # First try start:end match
-        if match is None: match = re.match('^('+rev_patt+')$', options.revision)   # Next, try start match
+        match = rev_range_re.match(options.revision)            # First try start:end match
+        if match is None: match = rev_single_re.match(options.revision)   # Next, try start match
         if match is None:
             parser.error("unexpected --revision argument format; see 'svn help log' for valid revision formats")
         rev = match.groups()
         options.rev_start = rev[0] if len(rev)>0 else None
         options.rev_end   = rev[1] if len(rev)>1 else None
+    if options.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    if options.batch_size > 1 and options.keep_revnum:
+        parser.error("--batch-size cannot be combined with --keep-revnum")
+    if options.export_jobs < 1:
+        parser.error("--export-jobs must be at least 1")
+    if options.verify_jobs < 1:
+        parser.error("--verify-jobs must be at least 1")
     if options.archive:
         options.keep_author = True
         options.keep_date   = True
@@ -78,6 +78,27 @@ os.environ['LC_MESSAGES'] = 'C'
 
 locale_encoding = locale.getpreferredencoding()
 
+# We start external programs from several threads at once (e.g. the background
+# "svn log" from prefetch_iter() while the main thread runs "svn export"). Without
+# close_fds, a child can inherit the write end of another command's stdout pipe
+# and keep it open, so that command's reader never sees EOF. (On Windows, Python 2
+# doesn't support close_fds along with redirected stdout/stderr.)
+_close_fds = os.name != "nt"
+
+# Options added to every "svn <subcommand>" we run. Our svn processes have their
+# stdout/stderr captured, so any auth/cert prompt would be invisible and simply
+# hang; fail right away instead.
+svn_global_args = ['--non-interactive']
+
+# svn subcommands which never change the versioned state of a working copy.
+# ("export" may overwrite WC file contents, but never what is under version-control.)
+_svn_readonly_cmds = frozenset(['status', 'st', 'info', 'log', 'list', 'ls', 'cat',
+    'diff', 'proplist', 'pl', 'propget', 'pg', 'export', 'help'])
+
+# Bumped for every other svn command, so callers caching WC state (see
+# run/common.py:in_svn) know when their cached copy is stale.
+svn_wc_generation = 0
+
 def get_encoding():
     return locale_encoding
 
@@ -91,7 +112,7 @@ def shell_quote(s):
         q = "'"
     return q + s.replace('\\', '\\\\').replace("'", "'\"'\"'") + q
 
-def _run_raw_command(cmd, args, fail_if_stderr=False, no_fail=False):
+def _run_raw_command(cmd, args, fail_if_stderr=False, no_fail=False, cwd=None):
     cmd_string = "%s %s" % (cmd,  " ".join(map(shell_quote, args)))
     color = 'BLUE_B'
     if cmd == 'svn' and args[0] in ['status', 'st', 'log', 'info', 'list', 'proplist', 'propget', 'update', 'up', 'cleanup', 'revert']:
@@ -99,7 +120,7 @@ def _run_raw_command(cmd, args, fail_if_stderr=False, no_fail=False):
         color = 'BLUE'
     ui.status("$ %s", cmd_string, level=ui.EXTRA, color=color)
     try:
-        pipe = Popen([cmd] + args, executable=cmd, stdout=PIPE, stderr=PIPE)
+        pipe = Popen([cmd] + args, executable=cmd, stdout=PIPE, stderr=PIPE, close_fds=_close_fds, cwd=cwd)
     except OSError:
         etype, value = sys.exc_info()[:2]
         raise ExternalCommandFailed(
@@ -114,6 +135,36 @@ def _run_raw_command(cmd, args, fail_if_stderr=False, no_fail=False):
             % (pipe.returncode, cmd_string, err, out))
     return out
 
+def _open_raw_command(cmd, args, cwd=None):
+    """
+    Start an external program and return its Popen object, leaving it to the
+    caller to consume stdout (e.g. for incrementally parsing large output).
+    """
+    cmd_string = "%s %s" % (cmd,  " ".join(map(shell_quote, args)))
+    ui.status("$ %s", cmd_string, level=ui.EXTRA, color='BLUE')
+    try:
+        pipe = Popen([cmd] + args, executable=cmd, stdout=PIPE, stderr=PIPE, bufsize=-1, close_fds=_close_fds, cwd=cwd)
+    except OSError:
+        etype, value = sys.exc_info()[:2]
+        raise ExternalCommandFailed(
+            "Failed running external program: %s\nError: %s"
+            % (cmd_string, "".join(traceback.format_exception_only(etype, value))))
+    pipe.cmd_string = cmd_string
+    return pipe
+
+def close_pipe(pipe):
+    """
+    Wait for a Popen object from open_svn() to exit, raising ExternalCommandFailed
+    if it failed.
+    """
+    err = pipe.stderr.read()
+    pipe.stdout.close()
+    pipe.stderr.close()
+    if pipe.wait() != 0:
+        raise ExternalCommandFailed(
+            "External program failed (return code %d): %s\n%s"
+            % (pipe.returncode, pipe.cmd_string, err))
+
 def _run_raw_shell_command(cmd, no_fail=False):
     ui.status("* %s", cmd, level=ui.EXTRA, color='BLUE')
     st, out = commands.getstatusoutput(cmd)
@@ -123,9 +174,10 @@ def _run_raw_shell_command(cmd, no_fail=False):
             % (st, cmd, out))
     return out
 
-def run_command(cmd, args=None, bulk_args=None, encoding=None, fail_if_stderr=False, no_fail=False):
+def run_command(cmd, args=None, bulk_args=None, encoding=None, fail_if_stderr=False, no_fail=False, cwd=None):
     """
-    Run a command without using the shell.
+    Run a command without using the shell. If 'cwd' is given, run the command
+    from that directory instead of the current working directory.
     """
     args = args or []
     bulk_args = bulk_args or []
@@ -138,7 +190,7 @@ def run_command(cmd, args=None, bulk_args=None, encoding=None, fail_if_stderr=Fa
 
     cmd = find_program(cmd)
     if not bulk_args:
-        return _run_raw_command(cmd, map(_transform_arg, args), fail_if_stderr, no_fail)
+        return _run_raw_command(cmd, map(_transform_arg, args), fail_if_stderr, no_fail, cwd)
     # If one of bulk_args starts with a dash (e.g. '-foo.php'),
     # svn will take this as an option. Adding '--' ends the search for
     # further options.
@@ -154,7 +206,7 @@ def run_command(cmd, args=None, bulk_args=None, encoding=None, fail_if_stderr=Fa
         sub_args = []
         for a in bulk_args[i:stop]:
             sub_args.append(_transform_arg(a))
-        out += _run_raw_command(cmd, args + sub_args, fail_if_stderr, no_fail)
+        out += _run_raw_command(cmd, args + sub_args, fail_if_stderr, no_fail, cwd)
         i = stop
     return out
 
@@ -187,11 +239,24 @@ def run_shell_command(cmd, args=None, bulk_args=None, encoding=None, no_fail=Fal
         i = stop
     return out
 
+def _add_svn_global_args(args):
+    """
+    Insert svn_global_args right after the svn subcommand name.
+    """
+    if not args or args[0].startswith('-'):
+        # e.g. "svn --version"
+        return args
+    return args[:1] + svn_global_args + args[1:]
+
 def run_svn(args=None, bulk_args=None, fail_if_stderr=False,
-            mask_atsign=False, no_fail=False):
+            mask_atsign=False, no_fail=False, cwd=None):
     """
     Run an SVN command, returns the (bytes) output.
     """
+    global svn_wc_generation
+    if args and args[0] not in _svn_readonly_cmds:
+        svn_wc_generation += 1
+    args = _add_svn_global_args(args)
     if mask_atsign:
         # The @ sign in Subversion revers to a pegged revision number.
         # SVN treats files with @ in the filename a bit special.
@@ -205,7 +270,20 @@ def run_svn(args=None, bulk_args=None, fail_if_stderr=False,
                     and bulk_args[idx][0] not in ("-", '"')):
                     bulk_args[idx] = "%s@" % bulk_args[idx]
     return run_command("svn",
-        args=args, bulk_args=bulk_args, fail_if_stderr=fail_if_stderr, no_fail=no_fail)
+        args=args, bulk_args=bulk_args, fail_if_stderr=fail_if_stderr, no_fail=no_fail, cwd=cwd)
+
+def open_svn(args, cwd=None):
+    """
+    Start an SVN command and return the Popen object, so that the (possibly very
+    large) output can be streamed from its stdout. Finish with close_pipe().
+    """
+    def _transform_arg(a):
+        if isinstance(a, unicode):
+            a = a.encode(locale_encoding or 'UTF-8')
+        elif not isinstance(a, str):
+            a = str(a)
+        return a
+    return _open_raw_command(find_program("svn"), map(_transform_arg, _add_svn_global_args(args)), cwd)
 
 def skip_dirs(paths, basedir="."):
     """
@@ -1,13 +1,15 @@
 """ SVN client functions """
 
-from shell import run_svn
-from errors import EmptySVNLog
+from shell import run_svn, open_svn, close_pipe, locale_encoding
+from errors import EmptySVNLog, ExternalCommandFailed
 
 import os
 import time
 import calendar
 import operator
 import urllib
+import hashlib
+import tempfile
 
 try:
     from xml.etree import cElementTree as ET
@@ -25,7 +27,24 @@ _forbidden_xml_chars = "".join(
     set(map(chr, range(32))) - set('\x09\x0A\x0D')
 )
 
-valid_svn_actions = "MARD"   # The list of known SVN action abbr's, from "svn log"
+valid_svn_actions = frozenset("MARD")   # The set of known SVN action abbr's, from "svn log"
+
+class ChangedPath(object):
+    """
+    A single changed-path entry (i.e. one <path> node) from an "svn log -v" log entry.
+    """
+    __slots__ = ('path', 'kind', 'action', 'copyfrom_path', 'copyfrom_revision')
+
+    def __init__(self, path, kind, action, copyfrom_path=None, copyfrom_revision=None):
+        self.path = path
+        self.kind = kind
+        self.action = action
+        self.copyfrom_path = copyfrom_path
+        self.copyfrom_revision = copyfrom_revision
+
+    def __repr__(self):
+        return "ChangedPath(%r, %r, %r, %r, %r)" % (self.path, self.kind, self.action,
+            self.copyfrom_path, self.copyfrom_revision)
 
 def _strip_forbidden_xml_chars(xml_string):
     """
@@ -34,6 +53,17 @@ def _strip_forbidden_xml_chars(xml_string):
     """
     return xml_string.translate(_identity_table, _forbidden_xml_chars)
 
+class _XMLCharFilter(object):
+    """
+    File-like wrapper which strips forbidden XML characters from everything read
+    through it, so that a stream can be fed straight to ET.iterparse().
+    """
+    def __init__(self, f):
+        self.f = f
+
+    def read(self, size=-1):
+        return _strip_forbidden_xml_chars(self.f.read(size))
+
 def safe_path(path, rev_number=None):
     """
     Build a path to pass as a SVN command-line arg.
@@ -100,16 +130,16 @@ def get_kind(svn_repos_url, svn_path, svn_rev, action, paths):
         parents = []
         for p in paths:
             # Build a list of any copy-from's in this log_entry that we're a child of.
-            if p['kind'] == 'dir' and p['copyfrom_revision'] and svn_path.startswith(p['path']+"/"):
-                parents.append(p['path'])
+            if p.kind == 'dir' and p.copyfrom_revision and svn_path.startswith(p.path+"/"):
+                parents.append(p.path)
         if parents:
             # Use the nearest copy-from'd parent
             parents.sort()
-            parent = parents[len(parents)-1]
+            parent = parents[-1]
             for p in paths:
-                if parent == p['path']:
-                    info_path = info_path.replace(p['path'], p['copyfrom_path'])
-                    info_rev =  p['copyfrom_revision']
+                if parent == p.path:
+                    info_path = p.copyfrom_path + info_path[len(p.path):]
+                    info_rev =  p.copyfrom_revision
         else:
             # If no parent copy-from's, then we should be able to check this path in
             # the preceeding revision.
@@ -117,51 +147,52 @@ def get_kind(svn_repos_url, svn_path, svn_rev, action, paths):
     svn_info = info(svn_repos_url+info_path, info_rev)
     return svn_info['kind']
 
+def _parse_svn_log_entry(entry):
+    """
+    Extract useful information from a single <logentry> node of "svn log --xml"
+    output, as a dict.
+    """
+    d = {}
+    d['revision'] = int(entry.get('revision'))
+    # Some revisions don't have authors, most notably the first revision
+    # in a repository.
+    # logentry nodes targeting directories protected by path-based
+    # authentication have no child nodes at all. We return an entry
+    # in that case. Anyway, as it has no path entries, no further
+    # processing will be made.
+    author = entry.find('author')
+    date = entry.find('date')
+    msg = entry.find('msg')
+    d['author'] = author is not None and author.text or "No author"
+    d['date_raw'] = date.text if date is not None else None
+    d['date'] = _svn_date_to_timestamp(date.text) if date is not None else None
+    # Pre-format the (local timezone) display date once, at parse time
+    d['date_str'] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(d['date'])) if date is not None else None
+    d['message'] = msg is not None and msg.text and msg.text.replace('\r\n', '\n').replace('\n\r', '\n').replace('\r', '\n') or ""
+    paths = []
+    for path in entry.findall('.//paths/path'):
+        copyfrom_rev = path.get('copyfrom-rev')
+        if copyfrom_rev:
+            copyfrom_rev = int(copyfrom_rev)
+        paths.append(ChangedPath(path.text, path.get('kind'), path.get('action'),
+            path.get('copyfrom-path'), copyfrom_rev))
+    # Sort paths (i.e. into hierarchical order), so that process_svn_log_entry()
+    # can process actions in depth-first order.
+    d['changed_paths'] = sorted(paths, key=operator.attrgetter('path'))
+    revprops = {}
+    for prop in entry.findall('.//revprops/property'):
+        revprops[prop.get('name')] = prop.text
+    d['revprops'] = revprops
+    return d
+
 def _parse_svn_log_xml(xml_string):
     """
     Parse the XML output from an "svn log" command and extract useful information
     as a list of dicts (one per log changeset).
     """
-    l = []
     xml_string = _strip_forbidden_xml_chars(xml_string)
     tree = ET.fromstring(xml_string)
-    for entry in tree.findall('logentry'):
-        d = {}
-        d['revision'] = int(entry.get('revision'))
-        # Some revisions don't have authors, most notably the first revision
-        # in a repository.
-        # logentry nodes targeting directories protected by path-based
-        # authentication have no child nodes at all. We return an entry
-        # in that case. Anyway, as it has no path entries, no further
-        # processing will be made.
-        author = entry.find('author')
-        date = entry.find('date')
-        msg = entry.find('msg')
-        d['author'] = author is not None and author.text or "No author"
-        d['date_raw'] = date.text if date is not None else None
-        d['date'] = _svn_date_to_timestamp(date.text) if date is not None else None
-        d['message'] = msg is not None and msg.text and msg.text.replace('\r\n', '\n').replace('\n\r', '\n').replace('\r', '\n') or ""
-        paths = []
-        for path in entry.findall('.//paths/path'):
-            copyfrom_rev = path.get('copyfrom-rev')
-            if copyfrom_rev:
-                copyfrom_rev = int(copyfrom_rev)
-            paths.append({
-                'path': path.text,
-                'kind': path.get('kind'),
-                'action': path.get('action'),
-                'copyfrom_path': path.get('copyfrom-path'),
-                'copyfrom_revision': copyfrom_rev,
-            })
-        # Sort paths (i.e. into hierarchical order), so that process_svn_log_entry()
-        # can process actions in depth-first order.
-        d['changed_paths'] = sorted(paths, key=operator.itemgetter('path'))
-        revprops = []
-        for prop in entry.findall('.//revprops/property'):
-            revprops.append({ 'name': prop.get('name'), 'value': prop.text })
-        d['revprops'] = revprops
-        l.append(d)
-    return l
+    return [_parse_svn_log_entry(entry) for entry in tree.findall('logentry')]
 
 def _parse_svn_status_xml(xml_string, base_dir=None, ignore_externals=False):
     """
@@ -229,6 +260,21 @@ def svn_checkout(svn_url, checkout_dir, rev_number=None):
     args += [safe_path(svn_url, rev_number), checkout_dir]
     return run_svn(args)
 
+def _revprop_args(get_revprops):
+    """
+    Build the "svn log" args for fetching revprops. 'get_revprops' can be True
+    (fetch all revprops) or a list of specific revprop names to fetch, which
+    avoids transferring e.g. every svn:log message when we don't need them.
+    """
+    if not get_revprops:
+        return []
+    if get_revprops is True:
+        return ['--with-all-revprops']
+    args = []
+    for name in get_revprops:
+        args += ['--with-revprop', name]
+    return args
+
 def run_svn_log(svn_url_or_wc, rev_start, rev_end, limit, stop_on_copy=False, get_changed_paths=True, get_revprops=False):
     """
     Fetch up to 'limit' SVN log entries between the given revisions.
@@ -238,16 +284,62 @@ def run_svn_log(svn_url_or_wc, rev_start, rev_end, limit, stop_on_copy=False, ge
         args += ['--stop-on-copy']
     if get_changed_paths:
         args += ['-v']
-    if get_revprops:
-        args += ['--with-all-revprops']
+    args += _revprop_args(get_revprops)
     args += ['-r', '%s:%s' % (rev_start, rev_end)]
     args += ['--limit', str(limit), safe_path(svn_url_or_wc, max(rev_start, rev_end))]
     xml_string = run_svn(args)
     return _parse_svn_log_xml(xml_string)
 
-def status(svn_wc, quiet=False, non_recursive=False):
+def iter_svn_log(svn_url_or_wc, rev_start, rev_end, limit=None, stop_on_copy=False, get_changed_paths=True, get_revprops=False, peg_rev=None):
     """
-    Get SVN status information about the given working copy.
+    Like run_svn_log(), but stream the "svn log" output and yield each log entry
+    as soon as it has been parsed, rather than buffering the whole XML document.
+    The path is pegged at 'peg_rev', defaulting to the end of the revision range.
+    """
+    args = ['log', '--xml']
+    if stop_on_copy:
+        args += ['--stop-on-copy']
+    if get_changed_paths:
+        args += ['-v']
+    args += _revprop_args(get_revprops)
+    args += ['-r', '%s:%s' % (rev_start, rev_end)]
+    if limit:
+        args += ['--limit', str(limit)]
+    args += [safe_path(svn_url_or_wc, peg_rev if peg_rev is not None else max(rev_start, rev_end))]
+    pipe = open_svn(args)
+    finished = False
+    try:
+        root = None
+        try:
+            for event, elem in ET.iterparse(_XMLCharFilter(pipe.stdout), events=('start', 'end')):
+                if root is None:
+                    root = elem
+                if event == 'end' and elem.tag == 'logentry':
+                    yield _parse_svn_log_entry(elem)
+                    # Release the parsed node (and drop it from the root <log> element,
+                    # which otherwise keeps every emptied node), to keep memory usage flat
+                    root.clear()
+        except SyntaxError:
+            # (ElementTree's ParseError is a SyntaxError.) If "svn log" failed, e.g.
+            # bad URL or auth error, its output is empty or cut short: raise svn's
+            # own error (ExternalCommandFailed) rather than the XML parse error.
+            close_pipe(pipe)
+            raise
+        finished = True
+    finally:
+        if not finished:
+            if pipe.poll() is None:
+                # Caller stopped iterating early; don't leave "svn log" running.
+                pipe.terminate()
+                pipe.wait()
+            pipe.stdout.close()
+            pipe.stderr.close()
+    close_pipe(pipe)
+
+def status(svn_wc, quiet=False, non_recursive=False, depth=None):
+    """
+    Get SVN status information about the given working copy. 'depth' can be
+    used to pass an explicit "--depth" (e.g. 'immediates') instead.
     """
     # Ensure proper stripping by canonicalizing the path
     svn_wc = os.path.abspath(svn_wc)
@@ -258,9 +350,38 @@ def status(svn_wc, quiet=False, non_recursive=False):
         args += ['-v']
     if non_recursive:
         args += ['-N']
+    if depth:
+        args += ['--depth', depth]
     xml_string = run_svn(args + [safe_path(svn_wc)])
     return _parse_svn_status_xml(xml_string, svn_wc, ignore_externals=True)
 
+def status_paths(paths, base_dir=".", depth=None):
+    """
+    Like status(), but for several paths (relative to the 'base_dir' working copy
+    folder) with a single "svn status" command. Returned paths are relative to
+    'base_dir'.
+    """
+    base_dir = os.path.abspath(base_dir)
+    args = ['status', '--xml', '--ignore-externals', '-v']
+    if depth:
+        args += ['--depth', depth]
+    # Pass the paths through a "--targets" file: passed as bulk_args, run_svn()
+    # would split a long list over several commands, and we'd get back several
+    # XML documents concatenated together.
+    fd, targets_path = tempfile.mkstemp(prefix="svn2svn-targets-")
+    try:
+        f = os.fdopen(fd, "w")
+        for p in paths:
+            p = safe_path(os.path.join(base_dir, p))
+            if isinstance(p, unicode):
+                p = p.encode(locale_encoding or 'UTF-8')
+            f.write(p + "\n")
+        f.close()
+        xml_string = run_svn(args + ['--targets', targets_path])
+    finally:
+        os.remove(targets_path)
+    return _parse_svn_status_xml(xml_string, base_dir, ignore_externals=True)
+
 def get_svn_versioned_files(svn_wc):
     """
     Get the list of versioned files in the SVN working copy.
@@ -275,9 +396,13 @@ def get_one_svn_log_entry(svn_url, rev_start, rev_end, stop_on_copy=False, get_c
     """
     Get the first SVN log entry in the requested revision range.
     """
-    entries = run_svn_log(svn_url, rev_start, rev_end, 1, stop_on_copy, get_changed_paths, get_revprops)
-    if entries:
-        return entries[0]
+    # Stream the output and stop "svn log" as soon as we have the one entry we
+    # want, rather than waiting for it to finish up.
+    entries = iter_svn_log(svn_url, rev_start, rev_end, 1, stop_on_copy, get_changed_paths, get_revprops)
+    entry = next(entries, None)
+    entries.close()
+    if entry is not None:
+        return entry
     raise EmptySVNLog("No SVN log for %s between revisions %s and %s" %
         (svn_url, rev_start, rev_end))
 
@@ -370,27 +495,45 @@ def iter_svn_log_entries(svn_url, first_rev, last_rev, stop_on_copy=False, get_c
                 cur_url = svn_repos_url+ancestors[0]['path']
                 cur_anc_end_rev = None
         #print "cur_rev:%s cur_anc_end_rev:%s cur_anc_idx:%s  %s" % (cur_rev, str(cur_anc_end_rev), cur_anc_idx, cur_url)
-        start_t = time.time()
         stop_rev = min(last_rev, cur_rev + chunk_length)
         stop_rev = min(stop_rev, cur_anc_end_rev) if cur_anc_end_rev else stop_rev
-        entries = run_svn_log(cur_url, cur_rev, stop_rev, chunk_length,
-                              stop_on_copy, get_changed_paths, get_revprops)
-        duration = time.time() - start_t
-        if entries:
-            for e in entries:
-                if e['revision'] > last_rev:
-                    break
-                # Embed the current URL in the yielded dict, for ancestor cases where
-                # we might have followed a copy-from to some non-original URL.
-                e['url'] = cur_url
-                yield e
+        entries = iter_svn_log(cur_url, cur_rev, stop_rev, chunk_length,
+                               stop_on_copy, get_changed_paths, get_revprops)
+        # Entries are streamed, so only count the time spent waiting on "svn log"
+        # (not the time our caller spends processing each entry) towards duration.
+        duration = 0.0
+        e = None
+        num_entries = 0
+        while True:
+            start_t = time.time()
+            next_e = next(entries, None)
+            duration += time.time() - start_t
+            if next_e is None:
+                break
+            e = next_e
+            num_entries += 1
+            if e['revision'] > last_rev:
+                break
+            # Embed the current URL in the yielded dict, for ancestor cases where
+            # we might have followed a copy-from to some non-original URL.
+            e['url'] = cur_url
+            yield e
+        entries.close()
+        if e is not None:
             if e['revision'] >= last_rev:
                 break
-            cur_rev = int(e['revision'])+1
+            # If we got fewer entries than the --limit, then we've already seen
+            # everything in cur_rev:stop_rev and can skip straight past it.
+            cur_rev = int(e['revision'])+1 if num_entries >= chunk_length else int(stop_rev)+1
         else:
             cur_rev = int(stop_rev)+1
         # Adapt chunk length based on measured request duration
-        if duration < log_duration_threshold:
+        if e is None:
+            # Nothing in this whole range, e.g. a long gap between changes to cur_url.
+            # Keep doubling the range (even past log_max_chunk_length), so that getting
+            # across a gap takes O(log(gap)) rather than O(gap) "svn log" calls.
+            chunk_length = int(chunk_length * 2.0)
+        elif duration < log_duration_threshold:
             chunk_length = min(log_max_chunk_length, int(chunk_length * 2.0))
         elif duration > log_duration_threshold * 2:
             chunk_length = max(log_min_chunk_length, int(chunk_length / 2.0))
@@ -428,14 +571,14 @@ def _parse_svn_propget_xml(xml_string):
 
 def _parse_svn_proplist_xml(xml_string):
     """
-    Parse the XML output from an "svn proplist" command and extract list
-    of property-names.
+    Parse the XML output from an "svn proplist -v" command and extract a dict
+    of property-names -> values.
     """
-    l = []
+    l = {}
     xml_string = _strip_forbidden_xml_chars(xml_string)
     tree = ET.fromstring(xml_string)
     for prop in tree.findall('.//property'):
-        l.append(prop.get('name'))
+        l[prop.get('name')] = prop.text and prop.text.replace('\r\n', '\n').replace('\n\r', '\n').replace('\r', '\n') or ""
     return l
 
 def propget(svn_url_or_wc, prop_name, rev_number=None):
@@ -453,43 +596,44 @@ def propget_all(svn_url_or_wc, rev_number=None):
     """
     Get the values of all versioned properties for the given path.
     """
-    l = {}
-    args = ['proplist', '--xml']
+    # "proplist -v" gives us all the values in one go, rather than needing
+    # an extra "svn propget" (and repo connection) per property.
+    args = ['proplist', '--xml', '-v']
     if rev_number:
         args += ['-r', rev_number]
     args += [safe_path(svn_url_or_wc, rev_number)]
     xml_string = run_svn(args)
-    props = _parse_svn_proplist_xml(xml_string)
-    for prop_name in props:
-        d = propget(svn_url_or_wc, prop_name, rev_number)
-        l[d['name']] = d['value']
-    return l
+    return _parse_svn_proplist_xml(xml_string)
 
-def update(path, non_recursive=False):
+def update(paths, non_recursive=False):
     """
-    Update a path in a working-copy.
+    Update one or more paths in a working-copy.
     """
+    if isinstance(paths, basestring):
+        paths = [paths]
     args = ['update', '--ignore-externals']
     if non_recursive:
         args += ['-N']
-    args += [safe_path(path)]
-    run_svn(args)
+    run_svn(args, [safe_path(p) for p in paths])
 
-def remove(path, force=False):
+def remove(paths, force=False):
     """
-    Remove a file/directory in a working-copy.
+    Remove one or more files/directories in a working-copy.
     """
+    if isinstance(paths, basestring):
+        paths = [paths]
     args = ['remove']
     if force:
         args += ['--force']
-    args += [safe_path(path)]
-    run_svn(args)
+    run_svn(args, [safe_path(p) for p in paths])
 
 def export(svn_url, rev_number, path, non_recursive=False, force=False):
     """
     Export a file from a repo to a local path.
     """
-    args = ['export', '--ignore-externals', '-r', rev_number]
+    # Nothing looks at the per-file "A  path" lines, so don't have svn print (and
+    # us buffer) one for every file of a large exported tree.
+    args = ['export', '--quiet', '--ignore-externals', '-r', rev_number]
     if non_recursive:
         args += ['-N']
     if force:
@@ -497,20 +641,44 @@ def export(svn_url, rev_number, path, non_recursive=False, force=False):
     args += [safe_path(svn_url, rev_number), safe_path(path)]
     run_svn(args)
 
+def cat_md5(svn_url, rev_number, strip_trailing_crlf=False):
+    """
+    Get the MD5 hex-digest of a file's contents in the repo, hashing the
+    "svn cat" output as it streams in. If 'strip_trailing_crlf', ignore a
+    trailing "\r\n" at the very end of the file. A path which doesn't exist
+    at 'rev_number' hashes like an empty file.
+    """
+    md5 = hashlib.md5()
+    pipe = open_svn(['cat', '-r', rev_number, safe_path(svn_url, rev_number)])
+    tail = ""
+    while True:
+        chunk = pipe.stdout.read(65536)
+        if not chunk:
+            break
+        if strip_trailing_crlf:
+            # Hold back the last 2 bytes until we know whether they're the end
+            chunk = tail + chunk
+            tail = chunk[-2:]
+            chunk = chunk[:-2]
+        md5.update(chunk)
+    if tail != "\r\n":
+        md5.update(tail)
+    try:
+        close_pipe(pipe)
+    except ExternalCommandFailed:
+        pass
+    return md5.hexdigest()
+
 def _parse_svn_list_xml(xml_string):
     """
     Parse the XML output from an "svn list" command and extract list
     of contents.
     """
-    l = []
     xml_string = _strip_forbidden_xml_chars(xml_string)
     tree = ET.fromstring(xml_string)
-    d = []
-    for entry in tree.findall('.//entry'):
-        d = { 'path': entry.find('.//name').text,
+    return [{ 'path': entry.findtext('name'),
               'kind': entry.get('kind') }
-        l.append(d)
-    return l
+            for entry in tree.getiterator('entry')]
 
 def list(svn_url_or_wc, rev_number=None, recursive=False):
     """
@@ -42,9 +42,28 @@ _colors = {
     'CYAN':     '36', 'CYAN_B':    '96',
     'WHITE':    '37', 'WHITE_B':   '97' }
 
+# Pre-built SGR escape sequences, keyed by (color, bold)
+_color_seqs = {}
+for _c in _colors:
+    _color_seqs[(_c, False)] = "\x1b[" + _colors[_c] + "m"
+    _color_seqs[(_c, True)] =  "\x1b[" + _colors[_c] + ";1m"
+_color_reset = "\x1b[0m"
+
 # Configuration
 _level = DEFAULT
 
+_isatty_cache = {}
+
+def _isatty(stream):
+    """Check (once per stream) if a stream is attached to a terminal."""
+    key = id(stream)
+    if key not in _isatty_cache:
+        try:
+            _isatty_cache[key] = stream.isatty()
+        except AttributeError:
+            _isatty_cache[key] = False
+    return _isatty_cache[key]
+
 def status(msg, *args, **kwargs):
     """Write a status message.
 
@@ -54,21 +73,28 @@ def status(msg, *args, **kwargs):
       level    : One of DEFAULT, VERBOSE or DEBUG.
       linebreak: If True a new line is appended to msg (default: True).
       truncate : Truncate output if larger then term width (default: False).
+      indent   : Number of indentation levels (two spaces each) to prefix msg with,
+                 e.g. for nested debug output (default: 0).
     """
     global _level
     level = kwargs.get('level', DEFAULT)
     if level > _level:
         return
-    width = termwidth()
     if args:
         msg = msg % args
+    indent = kwargs.get('indent', 0)
+    if indent:
+        msg = '  '*indent + msg
     if kwargs.get('linebreak', True):
         msg = '%s%s' % (msg, os.linesep)
     if level == ERROR:
+        # Don't let an error jump ahead of any buffered (VERBOSE/DEBUG) stdout output
+        sys.stdout.flush()
         stream = sys.stderr
     else:
         stream = sys.stdout
     if kwargs.get('truncate', False) and level != ERROR:
+        width = termwidth()
         add_newline = msg.endswith('\n')
         msglines = msg.splitlines()
         for no, line in enumerate(msglines):
@@ -82,9 +108,14 @@ def status(msg, *args, **kwargs):
     color = kwargs.get('color', None)
     bold =  kwargs.get('bold',  None)
     if color in _colors and os.name != 'nt':
-        msg = '%s%s%s' % ("\x1b["+_colors[color]+(";1" if bold else "")+"m", msg, "\x1b[0m")
+        msg = '%s%s%s' % (_color_seqs[(color, bool(bold))], msg, _color_reset)
     stream.write(msg)
-    stream.flush()
+    if level <= DEFAULT or _isatty(stream):
+        # When not writing to a terminal (e.g. output redirected to a log file),
+        # let VERBOSE/DEBUG output accumulate in the stream's buffer rather than
+        # doing a write() per line. The next DEFAULT-level message (e.g. each
+        # "Committed revision ...") flushes everything written before it.
+        stream.flush()
 
 def update_config(options):
     """Update UI configuration."""
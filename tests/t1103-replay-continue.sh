@@ -0,0 +1,67 @@
+#!/bin/bash
+
+test_description='Use svnreplay in continue-mode, picking-up from the saved rev_map file
+'
+. ./test-lib.sh
+. ./replay-lib.sh
+
+author='Tony Duckles <tony@nynim.org>'
+
+
+SVNREPLAY="../svnreplay.py"
+PWD=${TEST_DIRECTORY:-.}
+PWDURL=$(echo "file://$PWD" | sed 's/\ /%20/g')
+REPONAME="_repo_t1103"
+REPO="$PWD/$REPONAME"
+REPOURL=$(echo "file://$REPO" | sed 's/\ /%20/g')
+WC="$PWD/_wc_t1103"
+REVMAP="$WC/.svn/svn2svn-revmap"
+OFFSET="/trunk"
+
+test_expect_success \
+    "pre-cleanup" \
+    "rm -rf \"$WC\""
+
+test_expect_success \
+    "init repo $REPONAME" \
+    "init_replay_repo \"$REPO\""
+
+test_expect_success \
+    "svn mkdir $REPONAME$OFFSET" \
+    "svn mkdir -q -m \"Add $OFFSET\" $REPOURL$OFFSET"
+
+test_expect_success \
+    "svnreplay _repo_ref$OFFSET $REPONAME$OFFSET (first 5 revs)" \
+    "$SVNREPLAY -av --limit=5 --wc \"$WC\" \"$PWDURL/_repo_ref$OFFSET\" \"$REPOURL$OFFSET\" &&
+     test -s \"$REVMAP\""
+
+test_expect_success \
+    "non-continue-mode into non-empty target keeps the rev_map file" \
+    "cp \"$REVMAP\" \"$REVMAP.orig\" &&
+     ! $SVNREPLAY -av --wc \"$WC\" \"$PWDURL/_repo_ref$OFFSET\" \"$REPOURL$OFFSET\" &&
+     cmp \"$REVMAP.orig\" \"$REVMAP\""
+
+test_expect_success \
+    "svnreplay _repo_ref$OFFSET $REPONAME$OFFSET (continue, next 5 revs)" \
+    "$SVNREPLAY -avc --limit=5 --wc \"$WC\" \"$PWDURL/_repo_ref$OFFSET\" \"$REPOURL$OFFSET\" &&
+     test \$(grep -vc '^#' \"$REVMAP\") -gt \$(grep -vc '^#' \"$REVMAP.orig\")"
+
+test_expect_success \
+    "svnreplay _repo_ref$OFFSET $REPONAME$OFFSET (continue, partially-written rev_map line)" \
+    "printf '999' >> \"$REVMAP\" &&
+     $SVNREPLAY -avc --wc \"$WC\" \"$PWDURL/_repo_ref$OFFSET\" \"$REPOURL$OFFSET\" &&
+     ! grep -q '^999' \"$REVMAP\""
+
+test_expect_success \
+    "svnreplay _repo_ref$OFFSET $REPONAME$OFFSET (verify-all)" \
+    "$SVNREPLAY -avcX --wc \"$WC\" \"$PWDURL/_repo_ref$OFFSET\" \"$REPOURL$OFFSET\""
+
+test_expect_success \
+    "diff-repo _repo_ref$OFFSET $REPONAME$OFFSET" \
+    "./diff-repo.sh \"$PWDURL/_repo_ref$OFFSET\" \"$REPOURL$OFFSET\""
+
+test_expect_success \
+    "cleanup $REPONAME" \
+    "rm -rf \"$REPO\" \"$WC\""
+
+test_done
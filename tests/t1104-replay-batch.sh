@@ -0,0 +1,86 @@
+#!/bin/bash
+
+test_description='Use svnreplay with --batch-size to fold record-only merges, then pick-up in continue-mode
+'
+. ./test-lib.sh
+. ./replay-lib.sh
+
+author='Tony Duckles <tony@nynim.org>'
+
+
+SVNREPLAY="../svnreplay.py"
+PWD=${TEST_DIRECTORY:-.}
+SRCNAME="_repo_t1104_src"
+SRC="$PWD/$SRCNAME"
+SRCURL=$(echo "file://$SRC" | sed 's/\ /%20/g')
+SRCWC="$PWD/_wc_t1104_src"
+REPONAME="_repo_t1104"
+REPO="$PWD/$REPONAME"
+REPOURL=$(echo "file://$REPO" | sed 's/\ /%20/g')
+WC="$PWD/_wc_t1104"
+OFFSET="/trunk"
+
+test_expect_success \
+    "pre-cleanup" \
+    "rm -rf \"$SRC\" \"$SRCWC\" \"$WC\""
+
+# Source history (on /trunk):
+#   r2     Initial population
+#   r7-r9  Record-only merges of r4-r6 from /branches/test (svn:mergeinfo-only)
+#   r10    Content change
+test_expect_success \
+    "create source repo $SRCNAME" \
+    "svnadmin create \"$SRC\" &&
+     svn mkdir -q -m \"Add /trunk and /branches\" $SRCURL/trunk $SRCURL/branches &&
+     svn co -q $SRCURL/trunk \"$SRCWC\" &&
+     echo \"File1.txt (Initial)\" >> \"$SRCWC/File1.txt\" &&
+     svn add -q \"$SRCWC/File1.txt\" &&
+     svn ci -q -m \"Initial population\" \"$SRCWC\" &&
+     svn copy -q -m \"Create branch\" $SRCURL/trunk $SRCURL/branches/test &&
+     for i in 1 2 3; do
+         svn mkdir -q -m \"Branch change \$i\" $SRCURL/branches/test/Dir\$i || return 1
+     done &&
+     for rev in 4 5 6; do
+         svn up -q \"$SRCWC\" &&
+         svn merge -q --record-only -c \$rev $SRCURL/branches/test \"$SRCWC\" &&
+         svn ci -q -m \"Record-only merge of r\$rev\" \"$SRCWC\" || return 1
+     done &&
+     echo \"File1.txt (Changed)\" >> \"$SRCWC/File1.txt\" &&
+     svn ci -q -m \"Change File1.txt\" \"$SRCWC\""
+
+test_expect_success \
+    "init repo $REPONAME" \
+    "init_replay_repo \"$REPO\""
+
+test_expect_success \
+    "svn mkdir $REPONAME$OFFSET" \
+    "svn mkdir -q -m \"Add $OFFSET\" $REPOURL$OFFSET"
+
+# Initial import (r2), then fold r7+r8 into a single target commit
+test_expect_success \
+    "svnreplay $SRCNAME$OFFSET $REPONAME$OFFSET (batch-size, first 3 revs)" \
+    "$SVNREPLAY -av --batch-size=5 --limit=3 --wc \"$WC\" \"$SRCURL$OFFSET\" \"$REPOURL$OFFSET\" &&
+     test \$(svn log -q $REPOURL | grep -c '^r') -eq 3"
+
+# Drop the WC (and its saved rev_map file), so continue-mode has to rebuild
+# rev_map from the target's svn2svn:* revprops, where r7 and r8 both map to
+# the same target rev. This should resume after r8, folding r9 into r10.
+test_expect_success \
+    "svnreplay $SRCNAME$OFFSET $REPONAME$OFFSET (batch-size, continue)" \
+    "rm -rf \"$WC\" &&
+     $SVNREPLAY -avc --batch-size=5 --wc \"$WC\" \"$SRCURL$OFFSET\" \"$REPOURL$OFFSET\" &&
+     test \$(svn log -q $REPOURL | grep -c '^r') -eq 4"
+
+test_expect_success \
+    "svnreplay $SRCNAME$OFFSET $REPONAME$OFFSET (verify-all)" \
+    "$SVNREPLAY -avcX --wc \"$WC\" \"$SRCURL$OFFSET\" \"$REPOURL$OFFSET\""
+
+test_expect_success \
+    "diff-repo $SRCNAME$OFFSET $REPONAME$OFFSET" \
+    "./diff-repo.sh \"$SRCURL$OFFSET\" \"$REPOURL$OFFSET\""
+
+test_expect_success \
+    "cleanup $REPONAME" \
+    "rm -rf \"$SRC\" \"$SRCWC\" \"$REPO\" \"$WC\""
+
+test_done